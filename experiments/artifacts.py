@@ -0,0 +1,411 @@
+# main imports
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.urls import reverse
+
+# content type of generated artifacts (using key extension)
+content_types = {
+    'png': 'image/png',
+    'webp': 'image/webp',
+    'bmp': 'image/bmp',
+    'jpg': 'image/jpeg',
+}
+
+# artifact key is always an hexadecimal digest with an extension
+key_pattern = re.compile(r'^[0-9a-f]{16,64}\.[a-z0-9]{2,5}$')
+
+
+def artifact_key(data, extension):
+    """Build content-addressed key of an artifact
+    Args:
+        data ([bytes]): encoded artifact
+        extension ([str]): artifact extension (format)
+    Returns:
+        [str]: artifact key
+    """
+    return f'{hashlib.sha256(data).hexdigest()[:32]}.{extension}'
+
+
+def inputs_key(inputs, extension):
+    """Build key of an artifact from the inputs used to generate it (generation can be skipped if stored)
+    Args:
+        inputs ([dict]): JSON serializable inputs (including versions of generation process)
+        extension ([str]): artifact extension (format)
+    Returns:
+        [str]: artifact key
+    """
+    data = json.dumps(inputs, sort_keys=True).encode('utf-8')
+    return artifact_key(data, extension)
+
+
+def is_valid_key(key):
+    """Check if key is a valid artifact key (avoid any path injection)
+    """
+    return key_pattern.match(key) is not None and key.split('.')[-1] in content_types
+
+
+class ArtifactStore():
+    """
+    Generic store of generated artifacts (encoded stimuli) identified by key
+    """
+
+    def get(self, key):
+        """
+        Get artifact data
+
+        Return: bytes or None if not stored
+        """
+        raise NotImplementedError
+
+    def put(self, key, data):
+        """
+        Store artifact data with expected key
+        """
+        raise NotImplementedError
+
+    def contains(self, key) -> bool:
+        """
+        Check whether artifact is stored
+        """
+        raise NotImplementedError
+
+    def touch(self, key):
+        """
+        Mark artifact as recently used (artifact read from another store)
+        """
+        pass
+
+
+class MemoryArtifactStore(ArtifactStore):
+    """
+    Size-bounded LRU store kept in memory of the current process
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._artifacts = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            data = self._artifacts.get(key)
+
+            if data is not None:
+                self._artifacts.move_to_end(key)
+
+            return data
+
+    def put(self, key, data):
+        with self._lock:
+
+            if key in self._artifacts:
+                self._artifacts.move_to_end(key)
+                return
+
+            self._artifacts[key] = data
+            self.current_bytes += len(data)
+
+            # evict least recently used artifacts (always keep the last one)
+            while self.current_bytes > self.max_bytes and len(self._artifacts) > 1:
+                _, evicted = self._artifacts.popitem(last=False)
+                self.current_bytes -= len(evicted)
+
+    def contains(self, key) -> bool:
+        with self._lock:
+            return key in self._artifacts
+
+
+class FileSystemArtifactStore(ArtifactStore):
+    """
+    Store artifacts as files (shared between processes)
+
+    Files are sharded into hashed sub-folders (`ab/cd/abcd...png`) in order to keep
+    folders small. The disk usage is bounded by `max_bytes` and `ttl` (seconds since
+    last access): the folder is compacted each time `compact_every` bytes have been
+    written by the process, into a background thread (see also `compact_artifacts` command).
+    """
+
+    def __init__(self, folder, max_bytes=None, ttl=None, compact_every=64 * 1024 * 1024):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.compact_every = compact_every
+
+        self._written_bytes = 0
+        self._compaction = None
+        self._lock = threading.Lock()
+
+    def path(self, key):
+        return os.path.join(self.folder, key[0:2], key[2:4], key)
+
+    def get(self, key):
+
+        # artifacts stored before sharding are still available
+        for path in (self.path(key), os.path.join(self.folder, key)):
+            try:
+                with open(path, 'rb') as f:
+                    data = f.read()
+            except FileNotFoundError:
+                continue
+
+            # modification time is used as last access time (LRU eviction)
+            self._touch_path(path)
+
+            return data
+
+        return None
+
+    def _touch_path(self, path):
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def touch(self, key):
+        for path in (self.path(key), os.path.join(self.folder, key)):
+            if os.path.exists(path):
+                self._touch_path(path)
+                return
+
+    def put(self, key, data):
+
+        if self.contains(key):
+            return
+
+        path = self.path(key)
+
+        # write then rename, a concurrent reader never gets a partial file
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+
+        for attempt in range(2):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+            try:
+                with open(tmp_path, 'wb') as f:
+                    f.write(data)
+                break
+            except FileNotFoundError:
+                # empty folder removed by a concurrent compaction
+                if attempt > 0:
+                    raise
+
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._written_bytes += len(data)
+            compact = self._written_bytes >= self.compact_every
+            
+            if compact:
+                self._written_bytes = 0
+
+        if compact and (self.max_bytes is not None or self.ttl is not None):
+            self.compact_in_background()
+
+    def compact_in_background(self):
+        """
+        Compact the folder into a background thread (the folder can hold many files),
+        nothing is done if a compaction is already running into this process
+        """
+        with self._lock:
+            if self._compaction is not None and self._compaction.is_alive():
+                return
+
+            self._compaction = threading.Thread(target=self._run_compaction, name='artifacts-compaction', daemon=True)
+            self._compaction.start()
+
+    def _run_compaction(self):
+        try:
+            self.compact()
+        except Exception as e:
+            print(f'Artifacts compaction failed: {e}')
+
+    def contains(self, key) -> bool:
+        return os.path.exists(self.path(key)) or os.path.exists(os.path.join(self.folder, key))
+
+    def compact(self, max_bytes=None, ttl=None, legacy=False, dry_run=False) -> dict:
+        """
+        Shard artifacts stored before sharding, remove expired artifacts (TTL) then the least
+        recently used ones until disk usage is under the budget
+
+        Args:
+            max_bytes: disk budget (store budget by default)
+            ttl: time to live in seconds since last access (store TTL by default)
+            legacy: also remove expired files which are not artifacts (i.e. `<uuid>.png` files)
+            dry_run: only compute what would be done
+
+        Return: dict with number of files and bytes kept, moved and removed
+        """
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        ttl = self.ttl if ttl is None else ttl
+
+        stats = {'files': 0, 'bytes': 0, 'moved': 0, 'removed': 0, 'removed_bytes': 0}
+
+        if not os.path.exists(self.folder):
+            return stats
+
+        now = time.time()
+        entries = []
+
+        for root, _, filenames in os.walk(self.folder):
+            for filename in filenames:
+                path = os.path.join(root, filename)
+
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+
+                # temporary file of an interrupted write
+                if filename.endswith('.tmp'):
+                    if now - stat.st_mtime > 3600:
+                        entries.append((stat.st_mtime, stat.st_size, path, True))
+                    continue
+
+                if is_valid_key(filename):
+                    # shard artifacts stored before sharding
+                    if path != self.path(filename):
+                        if not dry_run:
+                            os.makedirs(os.path.dirname(self.path(filename)), exist_ok=True)
+                            os.replace(path, self.path(filename))
+                            path = self.path(filename)
+                        stats['moved'] += 1
+
+                elif not legacy or root != self.folder:
+                    continue
+
+                expired = ttl is not None and now - stat.st_mtime > ttl
+                entries.append((stat.st_mtime, stat.st_size, path, expired))
+
+        # least recently used first
+        entries.sort()
+
+        total_bytes = sum([ size for _, size, _, _ in entries ])
+
+        for _, size, path, expired in entries:
+
+            if not expired and (max_bytes is None or total_bytes <= max_bytes):
+                continue
+
+            if not dry_run:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+            total_bytes -= size
+            stats['removed'] += 1
+            stats['removed_bytes'] += size
+
+        stats['files'] = len(entries) - stats['removed']
+        stats['bytes'] = total_bytes
+
+        if not dry_run:
+            self._remove_empty_folders()
+
+        return stats
+
+    def _remove_empty_folders(self):
+
+        for root, _, _ in os.walk(self.folder, topdown=False):
+            if root != self.folder and len(os.listdir(root)) == 0:
+                try:
+                    os.rmdir(root)
+                except OSError:
+                    pass
+
+
+class TieredArtifactStore(ArtifactStore):
+    """
+    Chain of stores: artifacts are written into each store and read from the first
+    one which has it (a fallback hit is promoted to the previous stores)
+    """
+
+    def __init__(self, stores):
+        self.stores = stores
+
+    def get(self, key):
+        for i, store in enumerate(self.stores):
+            data = store.get(key)
+
+            if data is not None:
+                for previous_store in self.stores[:i]:
+                    previous_store.put(key, data)
+
+                # next stores keep their own last access time (e.g. filesystem LRU)
+                for next_store in self.stores[i + 1:]:
+                    next_store.touch(key)
+
+                return data
+
+        return None
+
+    def put(self, key, data):
+        for store in self.stores:
+            store.put(key, data)
+
+    def contains(self, key) -> bool:
+        return any(store.contains(key) for store in self.stores)
+
+
+def create_store(name):
+    """Create artifact store from its name (`memory` or `filesystem`)
+    """
+    if name == 'memory':
+        return MemoryArtifactStore(getattr(settings, 'ARTIFACT_MEMORY_MAX_BYTES', 128 * 1024 * 1024))
+
+    if name == 'filesystem':
+        return FileSystemArtifactStore(os.path.join(settings.RELATIVE_STATIC_URL, 'generated'),
+            max_bytes=getattr(settings, 'ARTIFACT_FILESYSTEM_MAX_BYTES', None),
+            ttl=getattr(settings, 'ARTIFACT_FILESYSTEM_TTL', None),
+            compact_every=getattr(settings, 'ARTIFACT_FILESYSTEM_COMPACT_EVERY', 64 * 1024 * 1024))
+
+    raise ValueError(f'Unknown artifact store: {name}')
+
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_artifact_store():
+    """Get the process-wide artifact store defined by `ARTIFACT_STORES` setting
+    Returns:
+        [ArtifactStore]: store instance
+    """
+    global _store
+
+    with _store_lock:
+        if _store is None:
+            stores = [ create_store(name) for name in getattr(settings, 'ARTIFACT_STORES', ['memory', 'filesystem']) ]
+            _store = stores[0] if len(stores) == 1 else TieredArtifactStore(stores)
+
+    return _store
+
+
+def artifact_url(key):
+    """Get url used to serve an artifact
+    """
+    return reverse('experiments:artifact', kwargs={'key': key})
+
+
+def store_artifact(data, extension, key=None):
+    """Store encoded artifact (content-addressed key by default)
+    Args:
+        data ([bytes]): encoded artifact
+        extension ([str]): artifact extension (format)
+        key ([str]): specific artifact key if necessary
+    Returns:
+        [str]: url of the stored artifact
+    """
+    if key is None:
+        key = artifact_key(data, extension)
+
+    get_artifact_store().put(key, data)
+
+    return artifact_url(key)
@@ -0,0 +1,390 @@
+# main imports
+import os
+import re
+import json
+import threading
+
+import numpy as np
+from PIL import Image
+
+from .images import load_image
+
+# number of samples (spp level) at the end of image filename: `<name>_<level>.<ext>`
+spp_level_pattern = re.compile(r'_(\d+)\.\w+$')
+
+# version of the pack and tiles formats
+pack_version = 1
+tiles_version = 1
+manifest_filename = 'manifest.json'
+
+
+class DatasetManifest():
+    """
+    Index of a dataset folder content, scanned once (see `get_manifest`)
+
+    Files and sub-folders (scenes) are sorted, images can also be accessed by their
+    spp level (number of samples) when it is available into their filename.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+
+        # any added, removed or renamed image leads to a new version
+        self.version = os.stat(folder).st_mtime_ns
+
+        entries = sorted(os.listdir(folder))
+
+        self.files = [ e for e in entries if not os.path.isdir(os.path.join(folder, e)) ]
+        self.folders = [ e for e in entries if os.path.isdir(os.path.join(folder, e)) ]
+
+        self.spp_levels = {}
+
+        for filename in self.files:
+            match = spp_level_pattern.search(filename)
+
+            if match is not None:
+                self.spp_levels[int(match.group(1))] = filename
+
+    @property
+    def n_files(self):
+        return len(self.files)
+
+    def scene(self, scene):
+        """
+        Get manifest of a scene (sub-folder) of the dataset
+        """
+        return get_manifest(os.path.join(self.folder, scene))
+
+    def n_images(self, scene):
+        """
+        Get number of images of a scene (sub-folder) of the dataset
+        """
+        return self.scene(scene).n_files
+
+
+_manifests = {}
+_manifests_lock = threading.Lock()
+
+def get_manifest(folder):
+    """Get process-wide manifest of a dataset folder (scanned again only if folder is modified)
+    Args:
+        folder ([str]): dataset folder path
+    Returns:
+        [DatasetManifest]: manifest of the folder
+    """
+    mtime = os.stat(folder).st_mtime_ns
+
+    with _manifests_lock:
+        manifest_mtime, manifest = _manifests.get(folder, (None, None))
+
+    if manifest is None or manifest_mtime != mtime:
+        manifest = DatasetManifest(folder)
+
+        with _manifests_lock:
+            _manifests[folder] = (mtime, manifest)
+
+    return manifest
+
+
+def pack_dataset(dataset_folder, output_folder):
+    """Convert a dataset folder (one sub-folder of images per scene) into a memory-mapped pack
+
+    Each scene is stored as a `.npy` array of shape (levels, H, W, C) where levels are
+    the sorted images of the scene. A `manifest.json` file describes all the scenes.
+
+    Args:
+        dataset_folder ([str]): dataset folder with scenes folders
+        output_folder ([str]): folder where pack will be saved
+    Returns:
+        [dict]: manifest of the pack
+    """
+    if not os.path.exists(output_folder):
+        os.makedirs(output_folder)
+
+    manifest = {
+        'version': pack_version,
+        'dataset': dataset_folder,
+        'scenes': {}
+    }
+
+    dataset_manifest = get_manifest(dataset_folder)
+
+    for scene in dataset_manifest.folders:
+
+        scene_folder = os.path.join(dataset_folder, scene)
+        images = dataset_manifest.scene(scene).files
+        first_image = np.array(Image.open(os.path.join(scene_folder, images[0])), 'uint8')
+
+        scene_filename = f'{scene}.npy'
+
+        # written level by level: the whole scene is never loaded in memory
+        scene_array = np.lib.format.open_memmap(os.path.join(output_folder, scene_filename), mode='w+',
+                                    dtype='uint8', shape=(len(images),) + first_image.shape)
+
+        for i, image in enumerate(images):
+            scene_array[i] = np.array(Image.open(os.path.join(scene_folder, image)), 'uint8')
+
+        scene_array.flush()
+        del scene_array
+
+        manifest['scenes'][scene] = {
+            'file': scene_filename,
+            'images': images,
+            'shape': [len(images)] + list(first_image.shape)
+        }
+
+    with open(os.path.join(output_folder, manifest_filename), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    return manifest
+
+
+class DatasetPack():
+    """
+    Read-only access to a memory-mapped dataset pack (see `pack_dataset`)
+
+    Images are never decoded: reading a block only touches the pages of the block.
+    """
+
+    def __init__(self, pack_folder):
+        self.pack_folder = pack_folder
+
+        with open(os.path.join(pack_folder, manifest_filename), 'r') as f:
+            self.manifest = json.load(f)
+
+        if self.manifest['version'] != pack_version:
+            raise ValueError(f'Unsupported dataset pack version: {self.manifest["version"]}')
+
+        self._scenes = {}
+        self._lock = threading.Lock()
+
+    @property
+    def scenes(self):
+        return list(self.manifest['scenes'].keys())
+
+    def images(self, scene):
+        """
+        Get sorted images filenames of a scene (index of an image is its level)
+        """
+        return self.manifest['scenes'][scene]['images']
+
+    def scene(self, scene):
+        """
+        Get memory-mapped array of a scene: (levels, H, W, C)
+        """
+        with self._lock:
+            scene_array = self._scenes.get(scene)
+
+            if scene_array is None:
+                scene_filename = self.manifest['scenes'][scene]['file']
+                scene_array = np.load(os.path.join(self.pack_folder, scene_filename), mmap_mode='r')
+                self._scenes[scene] = scene_array
+
+        return scene_array
+
+    def image(self, scene, index):
+        """
+        Get memory-mapped image of a scene (read-only, no copy)
+        """
+        return self.scene(scene)[index]
+
+    def read_block(self, scene, index, x1, y1, x2, y2):
+        """
+        Get memory-mapped block of an image (read-only, no copy)
+        """
+        return self.scene(scene)[index, y1:y2, x1:x2]
+
+
+_packs = {}
+_packs_lock = threading.Lock()
+
+def get_dataset_pack(pack_folder):
+    """Get process-wide instance of a dataset pack (reloaded if manifest is updated)
+    Args:
+        pack_folder ([str]): folder of the pack
+    Returns:
+        [DatasetPack]: pack instance
+    """
+    mtime = os.stat(os.path.join(pack_folder, manifest_filename)).st_mtime_ns
+
+    with _packs_lock:
+        pack_mtime, pack = _packs.get(pack_folder, (None, None))
+
+        if pack is None or pack_mtime != mtime:
+            pack = DatasetPack(pack_folder)
+            _packs[pack_folder] = (mtime, pack)
+
+    return pack
+
+
+def tile_dataset(dataset_folder, output_folder, tile_size=128):
+    """Convert a dataset folder (one sub-folder of images per scene) into tiled images
+
+    Each image (level) of a scene is split into `tile_size` x `tile_size` PNG tiles
+    saved as `<scene>/<level>/<ty>_<tx>.png`. A `manifest.json` file describes all the scenes:
+    shapes always have a channels axis, `ndim` being the number of dimensions of source images.
+
+    Args:
+        dataset_folder ([str]): dataset folder with scenes folders
+        output_folder ([str]): folder where tiles will be saved
+        tile_size ([int]): width and height of tiles
+    Returns:
+        [dict]: manifest of the tiled dataset
+    """
+    manifest = {
+        'version': tiles_version,
+        'dataset': dataset_folder,
+        'tile_size': tile_size,
+        'scenes': {}
+    }
+
+    dataset_manifest = get_manifest(dataset_folder)
+
+    for scene in dataset_manifest.folders:
+
+        scene_folder = os.path.join(dataset_folder, scene)
+        images = dataset_manifest.scene(scene).files
+
+        for i, image in enumerate(images):
+            image_array = np.array(Image.open(os.path.join(scene_folder, image)), 'uint8')
+            ndim = image_array.ndim
+
+            # grayscale images get a channels axis
+            if ndim == 2:
+                image_array = image_array[..., None]
+
+            h, w, c = image_array.shape
+
+            level_folder = os.path.join(output_folder, scene, str(i))
+
+            if not os.path.exists(level_folder):
+                os.makedirs(level_folder)
+
+            for ty in range(0, (h + tile_size - 1) // tile_size):
+                for tx in range(0, (w + tile_size - 1) // tile_size):
+                    tile = image_array[ty * tile_size:(ty + 1) * tile_size, tx * tile_size:(tx + 1) * tile_size]
+
+                    if c == 1:
+                        tile = tile[..., 0]
+
+                    Image.fromarray(tile).save(os.path.join(level_folder, f'{ty}_{tx}.png'), compress_level=1)
+
+        manifest['scenes'][scene] = {
+            'images': images,
+            'shape': [len(images)] + list(image_array.shape),
+            'ndim': ndim
+        }
+
+    with open(os.path.join(output_folder, manifest_filename), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    return manifest
+
+
+class TiledDataset():
+    """
+    Read regions of tiled dataset images (see `tile_dataset`)
+
+    Only the tiles intersecting the expected region are decoded (decoded tiles
+    are kept into the shared image cache).
+    """
+
+    def __init__(self, tiles_folder):
+        self.tiles_folder = tiles_folder
+
+        with open(os.path.join(tiles_folder, manifest_filename), 'r') as f:
+            self.manifest = json.load(f)
+
+        if self.manifest['version'] != tiles_version:
+            raise ValueError(f'Unsupported tiled dataset version: {self.manifest["version"]}')
+
+        self.tile_size = self.manifest['tile_size']
+
+    @property
+    def scenes(self):
+        return list(self.manifest['scenes'].keys())
+
+    def images(self, scene):
+        """
+        Get sorted images filenames of a scene (index of an image is its level)
+        """
+        return self.manifest['scenes'][scene]['images']
+
+    def read_region(self, scene, index, x1, y1, x2, y2):
+        """
+        Get region of an image by decoding only the intersecting tiles
+
+        Return: numpy array of shape (y2 - y1, x2 - x1, C), or (y2 - y1, x2 - x1) for grayscale images
+        """
+        scene_manifest = self.manifest['scenes'][scene]
+        shape = scene_manifest['shape']
+
+        # shapes of grayscale images written by previous versions have no channels axis
+        n_images, h, w = shape[:3]
+        c = shape[3] if len(shape) > 3 else 1
+        ndim = scene_manifest.get('ndim', len(shape) - 1)
+
+        # negative index as for a list of images
+        index = index % n_images
+
+        x1, y1 = max(x1, 0), max(y1, 0)
+        x2, y2 = min(x2, w), min(y2, h)
+
+        region = np.empty((max(y2 - y1, 0), max(x2 - x1, 0), c), 'uint8')
+
+        # grayscale images are read without channels axis
+        if ndim == 2:
+            output = region[..., 0]
+        else:
+            output = region
+
+        if region.size == 0:
+            return output
+
+        level_folder = os.path.join(self.tiles_folder, scene, str(index))
+        size = self.tile_size
+
+        for ty in range(y1 // size, (y2 - 1) // size + 1):
+            for tx in range(x1 // size, (x2 - 1) // size + 1):
+                tile = load_image(os.path.join(level_folder, f'{ty}_{tx}.png'))
+
+                if tile.ndim == 2:
+                    tile = tile[..., None]
+
+                # intersection between tile and region (image coordinates)
+                ix1, iy1 = max(x1, tx * size), max(y1, ty * size)
+                ix2, iy2 = min(x2, (tx + 1) * size), min(y2, (ty + 1) * size)
+
+                region[iy1 - y1:iy2 - y1, ix1 - x1:ix2 - x1] = \
+                    tile[iy1 - ty * size:iy2 - ty * size, ix1 - tx * size:ix2 - tx * size]
+
+        return output
+
+    def image(self, scene, index):
+        """
+        Get whole image of a scene
+        """
+        _, h, w = self.manifest['scenes'][scene]['shape'][:3]
+        return self.read_region(scene, index, 0, 0, w, h)
+
+
+_tiled_datasets = {}
+_tiled_datasets_lock = threading.Lock()
+
+def get_tiled_dataset(tiles_folder):
+    """Get process-wide instance of a tiled dataset (reloaded if manifest is updated)
+    Args:
+        tiles_folder ([str]): folder of the tiled dataset
+    Returns:
+        [TiledDataset]: tiled dataset instance
+    """
+    mtime = os.stat(os.path.join(tiles_folder, manifest_filename)).st_mtime_ns
+
+    with _tiled_datasets_lock:
+        tiled_mtime, tiled_dataset = _tiled_datasets.get(tiles_folder, (None, None))
+
+        if tiled_dataset is None or tiled_mtime != mtime:
+            tiled_dataset = TiledDataset(tiles_folder)
+            _tiled_datasets[tiles_folder] = (mtime, tiled_dataset)
+
+    return tiled_dataset
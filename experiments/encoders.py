@@ -0,0 +1,72 @@
+# main imports
+import io
+
+# default options of each supported format (Pillow `save` parameters)
+formats = {
+    'png': {
+        'extension': 'png',
+        'options': {'compress_level': 6, 'optimize': False}
+    },
+    'webp': {
+        'extension': 'webp',
+        'options': {'lossless': True, 'method': 0, 'quality': 0}
+    },
+    'bmp': {
+        'extension': 'bmp',
+        'options': {}
+    },
+}
+
+
+class ImageEncoder():
+    """
+    Encode generated stimuli (PIL image) using expected format and options
+    """
+
+    def __init__(self, format='png', **options):
+
+        if format not in formats:
+            raise ValueError(f'Unknown image format: {format} (available: {", ".join(formats)})')
+
+        self.format = format
+        self.extension = formats[format]['extension']
+        self.options = dict(formats[format]['options'], **options)
+
+        # WebP is only used as lossless format for stimuli
+        if format == 'webp':
+            self.options['lossless'] = True
+
+    def encode(self, pil_image) -> bytes:
+        """
+        Encode PIL image
+
+        Return: encoded bytes
+        """
+        buffer = io.BytesIO()
+        pil_image.save(buffer, format=self.format.upper(), **self.options)
+        return buffer.getvalue()
+
+    def __str__(self) -> str:
+        options = ', '.join([ f'{k}={v}' for k, v in self.options.items() ])
+        return f'{self.format}({options})'
+
+
+def get_encoder(config):
+    """Create image encoder using the `encoder` key of a session config
+
+    Usage example into Session config:
+        "encoder": "webp"
+        "encoder": {"format": "png", "compress_level": 1}
+
+    Args:
+        config ([dict]): session config (can be None)
+    Returns:
+        [ImageEncoder]: expected encoder (default PNG encoder if not specified)
+    """
+    encoder_config = (config or {}).get('encoder', 'png')
+
+    if isinstance(encoder_config, str):
+        return ImageEncoder(encoder_config)
+
+    encoder_config = dict(encoder_config)
+    return ImageEncoder(encoder_config.pop('format', 'png'), **encoder_config)
@@ -0,0 +1,124 @@
+import numpy as np
+
+from .quest_plus import psychometric_fun
+
+# Vectorised psychometric functions: `x` and parameters are broadcasted, hence a
+# whole (stim, parameters) grid is evaluated in one call with x of shape
+# (n_stim, 1) and each parameter of shape (n_param,).
+
+
+def unpack_params(params):
+    '''Get threshold, slope and lapse (0 if not part of parameters).'''
+    if len(params) == 3:
+        threshold, slope, lapse = params
+    else:
+        threshold, slope = params
+        lapse = 0.
+    return threshold, slope, lapse
+
+
+def erf(x):
+    '''Vectorised error function (Abramowitz and Stegun 7.1.26, absolute
+    error under 1.5e-7).'''
+    x = np.asarray(x, 'float64')
+    sign = np.sign(x)
+    x = np.abs(x)
+
+    t = 1. / (1. + 0.3275911 * x)
+    y = 1. - (((((1.061405429 * t - 1.453152027) * t) + 1.421413741) * t
+               - 0.284496736) * t + 0.254829592) * t * np.exp(-x * x)
+
+    return sign * y
+
+
+def logistic(x, threshold, slope, lapse, chance_level, corr_at_thresh):
+    b = 4 * slope
+    a = -b * threshold
+    return chance_level + (1 - lapse - chance_level) / (1 + np.exp(-(a + b * x)))
+
+
+def weibull(x, threshold, slope, lapse, chance_level, corr_at_thresh):
+    # scaled such as probability at threshold is `corr_at_thresh` (without lapse)
+    k = (-np.log((1 - corr_at_thresh) / (1 - chance_level))) ** (1 / slope)
+    return chance_level + (1 - lapse - chance_level) * \
+        (1 - np.exp(-(k * x / threshold) ** slope))
+
+
+def weibull_db(x, threshold, slope, lapse, chance_level, corr_at_thresh):
+    # x and threshold are expressed in dB, scaled as `weibull`
+    k = -np.log((1 - corr_at_thresh) / (1 - chance_level))
+    return chance_level + (1 - lapse - chance_level) * \
+        (1 - np.exp(-k * 10 ** (slope * (x - threshold) / 20)))
+
+
+def cumulative_gaussian(x, threshold, slope, lapse, chance_level, corr_at_thresh):
+    # slope is the inverse of the standard deviation
+    return chance_level + (1 - lapse - chance_level) * \
+        0.5 * (1 + erf((x - threshold) * slope / np.sqrt(2)))
+
+
+psychometric_functions = {
+    'logistic': logistic,
+    'weibull': weibull,
+    'weibull_db': weibull_db,
+    'cumulative_gaussian': cumulative_gaussian,
+}
+
+
+class PsychometricFunction(object):
+    '''Psychometric function of the registry with its chance level, usable as
+    QuestPlus function (`function(x, params)`).
+
+    name           - name of the function into `psychometric_functions`
+    chance_level   - e.g. 0.5 for 2AFC procedure
+    corr_at_thresh - probability at threshold (by default half way between
+                     chance level and 1)
+    '''
+
+    # whole grid is evaluated in one call (see `compute_likelihoods`)
+    vectorized = True
+
+    def __init__(self, name, chance_level=0., corr_at_thresh=None):
+        if name not in psychometric_functions:
+            raise ValueError(f'Unknown psychometric function: {name} '
+                             f'(available: {", ".join(psychometric_functions)})')
+
+        if corr_at_thresh is None:
+            corr_at_thresh = 1. - (1. - chance_level) / 2.
+
+        self.name = name
+        self.chance_level = chance_level
+        self.corr_at_thresh = corr_at_thresh
+
+        # identifies likelihood tables of the function
+        self.key = f'{name}(chance_level={chance_level}, corr_at_thresh={corr_at_thresh})'
+
+    def __call__(self, x, params):
+        threshold, slope, lapse = unpack_params(params)
+        return psychometric_functions[self.name](x, threshold, slope, lapse,
+                                                 self.chance_level,
+                                                 self.corr_at_thresh)
+
+    def __repr__(self):
+        return self.key
+
+
+def get_psychometric_function(config):
+    '''Get psychometric function from the `quest_function` key of a session
+    config, e.g.:
+        "quest_function": "weibull"
+        "quest_function": {"name": "weibull", "chance_level": 0.5}
+
+    Returns
+    -------
+    function : `psychometric_fun` (logistic) if not specified.'''
+    function_config = (config or {}).get('quest_function')
+
+    if function_config is None:
+        return psychometric_fun
+
+    if isinstance(function_config, str):
+        return PsychometricFunction(function_config)
+
+    function_config = dict(function_config)
+    return PsychometricFunction(function_config.pop('name'), **function_config)
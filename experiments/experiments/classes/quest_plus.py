@@ -1,4 +1,11 @@
+import time
+import struct
+import pickle
+import hashlib
+import threading
+import weakref
 from copy import deepcopy
+from collections import OrderedDict
 from itertools import product
 
 import numpy as np
@@ -41,10 +48,403 @@ def logistic(x, params, corr_at_thresh=threshold_prob, chance_level=chance_level
 def psychometric_fun( x , params ):
     return logistic(x , params ,  corr_at_thresh=threshold_prob, chance_level=chance_level)
 
+# parameters are broadcasted: a whole grid can be evaluated in one call
+psychometric_fun.vectorized = True
+
+class StimIndex(object):
+    '''Lookup of stim values into a stim domain: binary search into the
+    sorted domain (value to index map for a single exact lookup).'''
+
+    def __init__(self, stim_domain):
+        self.stim_domain = np.asarray(stim_domain)
+
+        # first index of each value (as a linear scan)
+        self.indices = {}
+        for i, value in enumerate(self.stim_domain.tolist()):
+            self.indices.setdefault(value, i)
+
+        self.sorted = bool(np.all(np.diff(self.stim_domain) >= 0))
+
+        # stable sort: first index of equal values comes first
+        self.order = np.argsort(self.stim_domain, kind='stable')
+        self.sorted_domain = self.stim_domain[self.order]
+
+    def find(self, contrasts, approximate=False):
+        '''Get index of each contrast into the stim domain (nearest value if
+        approximate).'''
+        if not approximate and np.ndim(contrasts) == 0:
+            index = self.indices.get(np.asarray(contrasts).item())
+
+            if index is not None:
+                return np.array([index], 'int64')
+
+        contrasts = np.atleast_1d(contrasts)
+
+        if not approximate:
+            return self._find_exact(contrasts)
+
+        if not self.sorted:
+            return np.abs(self.stim_domain[np.newaxis, :] -
+                          contrasts[:, np.newaxis]).argmin(axis=1)
+
+        # nearest of the two surrounding values (lower one if equidistant)
+        right = np.clip(np.searchsorted(self.stim_domain, contrasts), 1,
+                        max(len(self.stim_domain) - 1, 1))
+        left = right - 1
+
+        if len(self.stim_domain) == 1:
+            return np.zeros(len(contrasts), 'int64')
+
+        use_right = (self.stim_domain[right] - contrasts <
+                     contrasts - self.stim_domain[left])
+        return np.where(use_right, right, left)
+
+    def _find_exact(self, contrasts):
+
+        # floats of another type (e.g. python floats with float32 domain):
+        # compared as numpy does for a scalar, into the domain dtype
+        if contrasts.dtype.kind == 'f' and self.stim_domain.dtype.kind == 'f':
+            contrasts = contrasts.astype(self.stim_domain.dtype)
+
+        positions = np.searchsorted(self.sorted_domain, contrasts)
+        positions = np.minimum(positions, len(self.sorted_domain) - 1)
+
+        missing = np.flatnonzero(self.sorted_domain[positions] != contrasts)
+
+        if len(missing) > 0:
+            raise ValueError(f'Stim {contrasts[missing[0]]} is not part of stim domain')
+
+        return self.order[positions].astype('int64')
+
+
+def refine_axis(values, step, center, size):
+    '''Values of an axis at a given resolution: every `step`-th value of the
+    full resolution `values`, into a window of at most `size` values around
+    `center` (window is shifted at the bounds of the axis).'''
+    values = np.asarray(values)
+    center_idx = int(np.abs(values - center).argmin())
+
+    # grid aligned on the center
+    indices = np.arange(center_idx % step, len(values), step)
+    position = np.searchsorted(indices, center_idx)
+
+    start = min(max(position - size // 2, 0), max(len(indices) - size, 0))
+    return values[indices[start:start + size]]
+
+
+# bytes used by each (stim, parameters cell) couple: likelihoods and entropy
+# tables (float64 for both responses), and temporaries of chunked computation
+table_bytes_per_cell = 3 * 2 * 8
+chunk_bytes_per_cell = 5 * 2 * 8
+
+
+def compute_likelihoods(stim_domain, param_domain, function):
+    '''Compute likelihoods of (correct, incorrect) responses for all
+    combinations of stimulus and model parameter domains.'''
+    n_stim, n_param = stim_domain.shape[0], param_domain.shape[0]
+
+    likelihoods = np.zeros((n_stim, n_param, 2))
+
+    if getattr(function, 'vectorized', False):
+        # (n_stim, 1) stims with (n_param,) parameters: whole grid at once
+        likelihoods[:, :, 0] = function(stim_domain[:, np.newaxis],
+                                        param_domain.T)
+    else:
+        for p in range(n_param):
+            likelihoods[:, p, 0] = function(stim_domain, param_domain[p, :])
+
+    # assumes (correct, incorrect) responses
+    likelihoods[:, :, 1] = 1. - likelihoods[:, :, 0]
+
+    return likelihoods
+
+
+class LikelihoodCache(object):
+    '''Process-level cache of read-only likelihood tables shared by all
+    QuestPlus instances with same (stim domain, param grid, function).
+
+    Tables are kept into a LRU bounded by `max_bytes` (None for no limit), the
+    most recently used table is always kept as it is in use.
+
+    With `shared_memory`, tables are also stored into named shared memory
+    segments: other processes map the same table instead of computing it.
+    '''
+
+    # header of shared memory segment: ready flag (table fully written)
+    shm_header = 8
+
+    def __init__(self, shared_memory=False, timeout=10, max_bytes=None):
+        self.shared_memory = shared_memory
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+
+        # counters
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._tables = {}
+        self._entropy_tables = {}
+        self._log_tables = {}
+        self._segments = {}
+
+        # bytes of the tables of each key (least recently used first)
+        self._bytes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def key(self, stim_domain, param_domain, function):
+        '''Get key of likelihood table (digest of domains and function name).'''
+        digest = hashlib.sha1()
+
+        for domain in (stim_domain, param_domain):
+            domain = np.ascontiguousarray(domain)
+            digest.update(f'{domain.dtype.str}{domain.shape}'.encode('utf-8'))
+            digest.update(domain.tobytes())
+
+        function_key = getattr(function, 'key', None)
+        if function_key is None:
+            function_key = f'{function.__module__}.{function.__qualname__}'
+
+        digest.update(function_key.encode('utf-8'))
+
+        return digest.hexdigest()[:24]
+
+    def get(self, stim_domain, param_domain, function):
+        '''Get read-only likelihood table (computed or mapped at first use).'''
+        key = self.key(stim_domain, param_domain, function)
+
+        with self._lock:
+            likelihoods = self._tables.get(key)
+
+            if likelihoods is not None:
+                self._bytes.move_to_end(key)
+                self.hits += 1
+                return likelihoods
+
+            self.misses += 1
+
+            shape = (stim_domain.shape[0], param_domain.shape[0], 2)
+            likelihoods = None
+
+            if self.shared_memory:
+                likelihoods = self._get_shared(key, shape, stim_domain,
+                                               param_domain, function)
+
+            if likelihoods is None:
+                likelihoods = compute_likelihoods(stim_domain, param_domain,
+                                                  function)
+
+            likelihoods.setflags(write=False)
+            likelihoods = self._put(self._tables, key, likelihoods)
+
+        return likelihoods
+
+    def get_log_likelihoods(self, stim_domain, param_domain, function):
+        '''Get read-only log-likelihoods table of shape (n_stim * 2, n_param)
+        (rows are (stim, response) couples). Null likelihoods are clamped to
+        the smallest float, hence a null count never leads to NaN.'''
+        key = self.key(stim_domain, param_domain, function)
+
+        with self._lock:
+            table = self._log_tables.get(key)
+
+            if table is not None:
+                self._bytes.move_to_end(key)
+                return table
+
+        lk, _ = self.get_entropy_tables(stim_domain, param_domain, function)
+
+        table = np.log(np.maximum(lk, np.finfo('float64').tiny))
+        table.setflags(write=False)
+
+        with self._lock:
+            table = self._put(self._log_tables, key, table)
+
+        return table
+
+    def get_entropy_tables(self, stim_domain, param_domain, function):
+        '''Get read-only tables used by fused entropy computation: likelihoods
+        and `likelihoods * log(likelihoods)`, both of shape (n_stim * 2, n_param)
+        (rows are (stim, response) couples).'''
+        key = self.key(stim_domain, param_domain, function)
+
+        with self._lock:
+            tables = self._entropy_tables.get(key)
+
+            if tables is not None:
+                self._bytes.move_to_end(key)
+                return tables
+
+        likelihoods = self.get(stim_domain, param_domain, function)
+        n_stim, n_param, n_resp = likelihoods.shape
+
+        lk = np.ascontiguousarray(likelihoods.transpose(0, 2, 1))
+        lk = lk.reshape(n_stim * n_resp, n_param)
+
+        # x log(x) is 0 when x is 0
+        with np.errstate(divide='ignore', invalid='ignore'):
+            lk_log = np.where(lk > 0, lk * np.log(lk), 0.)
+
+        lk.setflags(write=False)
+        lk_log.setflags(write=False)
+
+        with self._lock:
+            tables = self._put(self._entropy_tables, key, (lk, lk_log))
+
+        return tables
+
+    def _put(self, tables, key, value):
+        '''Store table(s) of a key (lock is held by caller) and evict least
+        recently used keys when `max_bytes` is exceeded.'''
+        if key in tables:
+            self._bytes.move_to_end(key)
+            return tables[key]
+
+        arrays = value if isinstance(value, tuple) else (value,)
+        nbytes = sum(array.nbytes for array in arrays)
+
+        tables[key] = value
+        self._bytes[key] = self._bytes.get(key, 0) + nbytes
+        self._bytes.move_to_end(key)
+        self.current_bytes += nbytes
+
+        if self.max_bytes is not None:
+            while self.current_bytes > self.max_bytes and len(self._bytes) > 1:
+                self._remove(next(iter(self._bytes)))
+                self.evictions += 1
+
+        return value
+
+    def _remove(self, key):
+        '''Remove tables of a key (lock is held by caller).'''
+        self.current_bytes -= self._bytes.pop(key)
+
+        for tables in (self._tables, self._entropy_tables, self._log_tables):
+            tables.pop(key, None)
+
+        segment = self._segments.pop(key, None)
+
+        if segment is not None:
+            self._release(*segment)
+
+    def _get_shared(self, key, shape, stim_domain, param_domain, function):
+        from multiprocessing import shared_memory, resource_tracker
+
+        name = f'qp_lk_{key}'
+        size = self.shm_header + int(np.prod(shape)) * 8
+
+        try:
+            segment = shared_memory.SharedMemory(name=name, create=True,
+                                                 size=size)
+            created = True
+        except FileExistsError:
+            segment = shared_memory.SharedMemory(name=name)
+            created = False
+        except OSError:
+            # shared memory not available
+            return None
+
+        # segment is kept when a process stops (it is used by other processes,
+        # or by the next ones as its name only depends on the table)
+        try:
+            resource_tracker.unregister(segment._name, 'shared_memory')
+        except Exception:
+            pass
+
+        ready = np.ndarray((1,), 'uint8', segment.buf, 0)
+        likelihoods = np.ndarray(shape, 'float64', segment.buf,
+                                 self.shm_header)
+
+        if created:
+            likelihoods[:] = compute_likelihoods(stim_domain, param_domain,
+                                                 function)
+            ready[0] = 1
+        else:
+            # wait for the table computed by another process
+            start = time.monotonic()
+            while ready[0] != 1:
+                if time.monotonic() - start > self.timeout:
+                    del ready, likelihoods
+                    segment.close()
+                    return None
+                time.sleep(0.01)
+
+        # segment is kept open while the table is used (also by QuestPlus
+        # instances once removed from the cache): closing it before would
+        # unmap a table in use
+        weakref.finalize(likelihoods, segment.close)
+
+        self._segments[key] = (segment, created)
+        return likelihoods
+
+    def _release(self, segment, created):
+        '''Remove a shared memory segment created by this process (the
+        segment is closed once its table is no more used).'''
+        from multiprocessing import resource_tracker
+
+        if not created:
+            return
+
+        # `unlink` also unregisters the segment from the resource tracker
+        resource_tracker.register(segment._name, 'shared_memory')
+
+        try:
+            segment.unlink()
+        except FileNotFoundError:
+            resource_tracker.unregister(segment._name, 'shared_memory')
+
+    def clear(self):
+        '''Remove cached tables (shared memory segments created by this
+        process are removed).'''
+        with self._lock:
+            for key in list(self._bytes):
+                self._remove(key)
+
+    def stats(self) -> dict:
+        '''Get cache usage information (hits, misses, evictions and memory).'''
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'tables': len(self._bytes),
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes
+            }
+
+
+# process-level likelihoods cache
+likelihood_cache = LikelihoodCache()
+
+
+# Compact state of a QuestPlus instance: only the posterior and histories are stored,
+# the domains and likelihoods are rebuilt from the experiment parameters
+#   header: magic, version, flags (log space), dtype code, posterior size, history size,
+#           pruned mass (since version 2)
+#   then: posterior (dtype), stim history (float64), response history (int8)
+state_magic = b'QPS'
+state_version = 2
+state_headers = {
+    1: struct.Struct('<3sBBBII'),
+    2: struct.Struct('<3sBBBIId'),
+}
+state_dtypes = {
+    0: np.dtype('<f8'),
+    1: np.dtype('<f4'),
+}
+state_log_space = 1
+
+
+def is_state(data):
+    '''Check whether binary data is a compact state (and not a legacy pickle).'''
+    return bytes(data[:len(state_magic)]) == state_magic
+
+
 # TODO:
 # - [ ] highlight lowest point in entropy in plot
 class QuestPlus(object):
-    def __init__(self, stim, params, function):
+    def __init__(self, stim, params, function, max_bytes=None):
         self.function = function
         self.stim_domain = stim
         self.param_domain = reformat_params(params)
@@ -57,15 +457,22 @@ class QuestPlus(object):
 
         n_stim, n_param = self.stim_domain.shape[0], self.param_domain.shape[0]
 
-        # setup likelihoods for all combinations
-        # of stimulus and model parameter domains
-        self.likelihoods = np.zeros((n_stim, n_param, 2))
-        for p in range(n_param):
-            self.likelihoods[:, p, 0] = self.function(self.stim_domain,
-                                                      self.param_domain[p, :])
+        # chunked mode: if likelihood tables (likelihoods and entropy tables)
+        # exceed `max_bytes`, they are never stored but computed by chunks of
+        # parameters cells, each chunk being under `max_bytes`
+        tables_bytes = table_bytes_per_cell * n_stim * n_param
+        self.chunked = max_bytes is not None and tables_bytes > max_bytes
+        self.chunk_size = (max(1, int(max_bytes // (chunk_bytes_per_cell * n_stim)))
+                           if self.chunked else n_param)
 
-        # assumes (correct, incorrect) responses
-        self.likelihoods[:, :, 1] = 1. - self.likelihoods[:, :, 0]
+        # likelihoods for all combinations of stimulus and model parameter
+        # domains (read-only table shared by all instances)
+        if self.chunked:
+            self.likelihoods = None
+        else:
+            self.likelihoods = likelihood_cache.get(self.stim_domain,
+                                                    self.param_domain,
+                                                    self.function)
 
         # we also assume a flat prior (so we init posterior to flat too)
         self.posterior = np.ones(n_param)
@@ -74,6 +481,76 @@ class QuestPlus(object):
         self.stim_history = list()
         self.resp_history = list()
         self.entropy = np.ones(n_stim)
+        self._stim_index = StimIndex(self.stim_domain)
+
+        # sparse mode (see `set_pruning`)
+        self.prune_threshold = None
+        self.prune_max_mass = 0.
+        self.pruned_mass = 0.
+        self.active = None
+
+    def set_pruning(self, threshold, max_mass):
+        '''Enable sparse mode: after each update, parameters cells with a
+        posterior probability below `threshold` are dropped (posterior set to
+        0) and are no more evaluated by updates and entropy computation.
+
+        The total posterior mass dropped during the procedure (measured when
+        cells are dropped) never exceeds `max_mass`: once this budget is
+        spent, no more cells are dropped.
+        '''
+        self.prune_threshold = threshold
+        self.prune_max_mass = max_mass
+        self.pruned_mass = getattr(self, 'pruned_mass', 0.)
+
+        # cells already dropped (i.e. restored state)
+        self._set_active(np.flatnonzero(self.posterior > 0))
+
+    def _set_active(self, active, subset=False):
+        if len(active) == self.posterior.shape[0]:
+            active = None
+
+        self.active = active
+
+        # sliced tables of a superset of active cells can still be used
+        if not subset:
+            self._active_tables = None
+
+    def prune(self):
+        '''Drop cells of lowest posterior probability (see `set_pruning`).
+
+        Returns
+        -------
+        mass : posterior mass dropped.'''
+        if self.prune_threshold is None:
+            return 0.
+
+        active = (np.arange(self.posterior.shape[0]) if self.active is None
+                  else self.active)
+        posterior = self.posterior[active]
+
+        candidates = np.flatnonzero(posterior < self.prune_threshold)
+        if len(candidates) == 0 or len(candidates) == len(active):
+            return 0.
+
+        # lowest cells first, while mass budget allows it
+        candidates = candidates[np.argsort(posterior[candidates])]
+        budget = self.prune_max_mass - self.pruned_mass
+        n_dropped = np.searchsorted(np.cumsum(posterior[candidates]), budget,
+                                    side='right')
+
+        if n_dropped == 0:
+            return 0.
+
+        dropped = candidates[:n_dropped]
+        mass = posterior[dropped].sum()
+
+        self.posterior[active[dropped]] = 0.
+        self.posterior /= self.posterior.sum()
+        self.pruned_mass += mass
+
+        self._set_active(np.delete(active, dropped), subset=True)
+
+        return mass
 
     def update(self, contrast, ifcorrect, approximate=False):
         '''Update posterior probability with outcome of current trial.
@@ -89,23 +566,172 @@ class QuestPlus(object):
             contrast,  approximate=approximate)[0]
 
         # take likelihood of such resp for whole model parameter domain
-        likelihood = self.likelihoods[contrast_idx, :, resp_idx]
-        self.posterior *= likelihood
+        if getattr(self, 'chunked', False):
+            likelihood = compute_likelihoods(
+                self.stim_domain[contrast_idx:contrast_idx + 1],
+                self.param_domain, self.function)[0, :, resp_idx]
+        else:
+            likelihood = self.likelihoods[contrast_idx, :, resp_idx]
+
+        if getattr(self, 'active', None) is None:
+            self.posterior *= likelihood
+        else:
+            # sparse mode: dropped cells are always 0
+            self.posterior[self.active] *= likelihood[self.active]
+
         self.posterior /= self.posterior.sum()
 
+        if getattr(self, 'prune_threshold', None) is not None:
+            self.prune()
+
         # log history of contrasts and responses
         self.stim_history.append(contrast)
         self.resp_history.append(ifcorrect)
 
     def _find_contrast_index(self, contrast, approximate=False):
-        contrast = np.atleast_1d(contrast)
-        if not approximate:
-            idx = [np.nonzero(self.stim_domain == cntrst)[0][0]
-                   for cntrst in contrast]
-        else:
-            idx = np.abs(self.stim_domain[np.newaxis, :] -
-                         contrast[:, np.newaxis]).argmin(axis=1)
-        return idx
+        # lookup is not part of legacy pickled instances
+        if getattr(self, '_stim_index', None) is None:
+            self._stim_index = StimIndex(self.stim_domain)
+
+        return self._stim_index.find(contrast, approximate=approximate)
+
+    def _get_entropy_buffers(self):
+        # tables and buffers are not part of legacy pickled instances
+        if getattr(self, '_entropy_buffers', None) is None:
+            lk, lk_log = likelihood_cache.get_entropy_tables(
+                self.stim_domain, self.param_domain, self.function)
+            n_rows, n_param = lk.shape
+
+            self._entropy_tables = (lk, lk_log)
+            self._entropy_buffers = {
+                'post_log': np.empty(n_param),
+                'norm': np.empty(n_rows),
+                'lk_log': np.empty(n_rows),
+                'post_log_lk': np.empty(n_rows),
+                'joint': np.empty(n_rows),
+            }
+
+        return self._entropy_tables, self._entropy_buffers
+
+    def fused_entropy(self):
+        '''Compute expected entropy of each stimulus in a single pass.
+
+        For each (stim, response) row, with normalisation n = L @ p:
+            n H = n log(n) - (L log L) @ p - L @ (p log p)
+        hence only three matrix-vector products over precomputed tables are
+        needed (no full posterior tensor). Expected entropy is updated in
+        self.entropy.
+
+        Returns
+        -------
+        entropy : minimal expected entropy.
+        contrast : contrast value minimizing entropy.'''
+        if getattr(self, 'chunked', False):
+            return self._chunked_entropy()
+
+        (lk, lk_log), buffers = self._get_entropy_buffers()
+        posterior = self.posterior
+
+        # sparse mode: only columns of remaining cells are evaluated (tables
+        # are sliced again when enough cells have been dropped)
+        if getattr(self, 'active', None) is not None:
+            if (self._active_tables is None or
+                    len(self.active) < 0.75 * len(self._active_tables[0])):
+                self._active_tables = (self.active,
+                                       np.ascontiguousarray(lk[:, self.active]),
+                                       np.ascontiguousarray(lk_log[:, self.active]))
+            columns, lk, lk_log = self._active_tables
+            posterior = self.posterior[columns]
+
+        post_log = buffers['post_log'][:posterior.shape[0]]
+        norm = buffers['norm']
+        joint = buffers['joint']
+
+        # p log(p) is 0 when p is 0
+        with np.errstate(divide='ignore', invalid='ignore'):
+            np.log(posterior, out=post_log)
+            np.multiply(post_log, posterior, out=post_log)
+        post_log[posterior <= 0] = 0.
+
+        np.dot(lk, posterior, out=norm)
+        np.dot(lk_log, posterior, out=buffers['lk_log'])
+        np.dot(lk, post_log, out=buffers['post_log_lk'])
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            np.log(norm, out=joint)
+            np.multiply(joint, norm, out=joint)
+        joint[norm <= 0] = 0.
+
+        joint -= buffers['lk_log']
+        joint -= buffers['post_log_lk']
+
+        # sum over responses of each stim
+        self.entropy = joint.reshape(-1, 2).sum(axis=1)
+
+        idx = self.entropy.argmin()
+        return self.entropy[idx], self.stim_domain[idx]
+
+    def _chunked_entropy(self):
+        # same computation as `fused_entropy`, accumulated over chunks of
+        # parameters cells (likelihoods of each chunk are computed on the fly)
+        n_rows = self.stim_domain.shape[0] * 2
+        columns = (np.arange(self.param_domain.shape[0]) if self.active is None
+                   else self.active)
+
+        norm = np.zeros(n_rows)
+        terms = np.zeros(n_rows)
+
+        for start in range(0, len(columns), self.chunk_size):
+            cells = columns[start:start + self.chunk_size]
+            posterior = self.posterior[cells]
+
+            lk = compute_likelihoods(self.stim_domain, self.param_domain[cells],
+                                     self.function)
+            lk = lk.transpose(0, 2, 1).reshape(n_rows, len(cells))
+
+            with np.errstate(divide='ignore', invalid='ignore'):
+                lk_log = np.where(lk > 0, lk * np.log(lk), 0.)
+                post_log = np.where(posterior > 0,
+                                    posterior * np.log(posterior), 0.)
+
+            norm += lk @ posterior
+            terms += lk_log @ posterior
+            terms += lk @ post_log
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            joint = np.where(norm > 0, norm * np.log(norm), 0.)
+        joint -= terms
+
+        # sum over responses of each stim
+        self.entropy = joint.reshape(-1, 2).sum(axis=1)
+
+        idx = self.entropy.argmin()
+        return self.entropy[idx], self.stim_domain[idx]
+
+    def _chunked_axis_posterior(self, axis):
+        # (n_stim, n_values, 2) posterior of responses reduced to one
+        # parameter axis, accumulated over chunks of parameters cells
+        n_values = self._orig_param_shape[axis]
+        columns = (np.arange(self.param_domain.shape[0]) if self.active is None
+                   else self.active)
+
+        # value index on the axis of each parameters cell (product order)
+        values_idx = np.unravel_index(columns, self._orig_param_shape)[axis]
+        reduced = np.zeros((self.stim_domain.shape[0], n_values, 2))
+
+        for start in range(0, len(columns), self.chunk_size):
+            cells = columns[start:start + self.chunk_size]
+
+            lk = compute_likelihoods(self.stim_domain, self.param_domain[cells],
+                                     self.function)
+            lk *= self.posterior[cells][np.newaxis, :, np.newaxis]
+
+            one_hot = np.zeros((len(cells), n_values))
+            one_hot[np.arange(len(cells)), values_idx[start:start + self.chunk_size]] = 1.
+
+            reduced += np.einsum('scr,ca->sar', lk, one_hot)
+
+        return reduced
 
     def next_contrast(self, axis=None):
         '''Get contrast value minimizing entropy of the posterior
@@ -116,9 +742,14 @@ class QuestPlus(object):
         Returns
         -------
         contrast : contrast value for the next trial.'''
-        full_posterior = self.likelihoods * self.posterior[
-            np.newaxis, :, np.newaxis]
-        if axis is not None:
+        if axis is None:
+            return self.fused_entropy()[1]
+
+        if getattr(self, 'chunked', False):
+            full_posterior = self._chunked_axis_posterior(axis)
+        else:
+            full_posterior = self.likelihoods * self.posterior[
+                np.newaxis, :, np.newaxis]
             shp = full_posterior.shape
             new_shape = [shp[0]] + self._orig_param_shape + [shp[-1]]
             full_posterior = full_posterior.reshape(new_shape)
@@ -141,16 +772,7 @@ class QuestPlus(object):
         Returns 
         -------
         entropy : the entropy.'''
-        
-        full_posterior = self.likelihoods * self.posterior[
-                np.newaxis, :, np.newaxis]
-        norm = full_posterior.sum(axis=1, keepdims=True)
-        full_posterior /= norm
-
-        H = -np.nansum(full_posterior * np.log(full_posterior), axis=1)
-        self.entropy = (norm[:, 0, :] * H).sum(axis=1)
-        
-        return self.entropy.min()
+        return self.fused_entropy()[0]
     
     def get_posterior(self):
     	return self.posterior.reshape(self._orig_param_shape)
@@ -165,11 +787,334 @@ class QuestPlus(object):
                     self.param_domain).sum(axis=0)
 
     def fit(self, contrasts, responses, approximate=False):
-        for contrast, response in zip(contrasts, responses):
-            self.update(contrast, response, approximate=approximate)
+        # sparse mode drops cells after each update
+        if getattr(self, 'prune_threshold', None) is not None:
+            for contrast, response in zip(contrasts, responses):
+                self.update(contrast, response, approximate=approximate)
+        else:
+            self.replay(contrasts, responses, approximate=approximate)
+
+    def history_counts(self, contrasts, responses, approximate=False):
+        '''Collapse trials into (n_stim, 2) counts of (correct, incorrect)
+        responses for each stim.'''
+        counts = np.zeros((self.stim_domain.shape[0], 2))
+
+        if len(contrasts) > 0:
+            stim_idx = self._find_contrast_index(contrasts,
+                                                 approximate=approximate)
+            resp_idx = 1 - np.asarray(responses, 'int64')
+            np.add.at(counts, (stim_idx, resp_idx), 1)
+
+        return counts
+
+    def replay(self, contrasts, responses, approximate=False):
+        '''Update posterior with a whole history of trials at once: trials are
+        collapsed into (stim, response) counts and the log posterior is
+        obtained with a single product over log-likelihoods.'''
+        counts = self.history_counts(contrasts, responses,
+                                     approximate=approximate)
+
+        # only the presented stims are needed
+        used = np.flatnonzero(counts.sum(axis=1))
+
+        if len(used) > 0:
+            if getattr(self, 'chunked', False):
+                self._apply_counts(self.stim_domain[used], counts[used])
+            else:
+                self._apply_counts(self.stim_domain[used], counts[used],
+                                   likelihoods=self.likelihoods[used])
+
+        self.stim_history.extend(list(contrasts))
+        self.resp_history.extend(list(responses))
+
+    def _apply_counts(self, stim_values, counts, likelihoods=None):
+        # (n_used, 2) counts of `stim_values` with their (n_used, n_param, 2)
+        # likelihoods, computed by chunks of parameters cells if not given
+        tiny = np.finfo('float64').tiny
+
+        with np.errstate(divide='ignore'):
+            log_posterior = np.log(self.posterior)
+
+        if likelihoods is not None:
+            log_lk = np.log(np.maximum(likelihoods, tiny))
+            log_posterior += np.einsum('spr,sr->p', log_lk, counts)
+        else:
+            # same bytes per chunk as with the whole stim domain
+            n_param = self.param_domain.shape[0]
+            chunk_size = max(1, getattr(self, 'chunk_size', n_param) *
+                             self.stim_domain.shape[0] // len(stim_values))
+
+            for start in range(0, n_param, chunk_size):
+                cells = slice(start, start + chunk_size)
+                log_lk = compute_likelihoods(stim_values,
+                                             self.param_domain[cells],
+                                             self.function)
+                np.log(np.maximum(log_lk, tiny, out=log_lk), out=log_lk)
+                log_posterior[cells] += np.einsum('spr,sr->p', log_lk, counts)
+
+        log_posterior -= log_posterior.max()
+        self.posterior = np.exp(log_posterior)
+        self.posterior /= self.posterior.sum()
+
+    def refine(self, stim, params, max_bytes=None):
+        '''Get QuestPlus instance on other (i.e. finer) domains with the same
+        history: the posterior is projected onto the new parameters grid by
+        replaying the history (stims of the history do not need to be part
+        of the new stim domain).
+
+        With sparse mode, the posterior mass of the cells outside of the new
+        parameters grid is added to the pruned mass, and the refined instance
+        is pruned with the same settings.'''
+        qp = type(self)(stim, params, self.function, max_bytes=max_bytes)
+
+        if len(self.stim_history) > 0:
+            values, inverse = np.unique(np.asarray(self.stim_history, 'float64'),
+                                        return_inverse=True)
+            counts = np.zeros((len(values), 2))
+            np.add.at(counts, (inverse, 1 - np.asarray(self.resp_history, 'int64')), 1)
+
+            # likelihoods are computed by chunks of the new parameters cells
+            qp._apply_counts(values, counts)
+
+        qp.stim_history = list(self.stim_history)
+        qp.resp_history = list(self.resp_history)
+
+        if getattr(self, 'prune_threshold', None) is not None:
+            # mass of cells out of the bounds of the new grid (truncated by the window)
+            outside = np.any((self.param_domain < qp.param_domain.min(axis=0)) |
+                             (self.param_domain > qp.param_domain.max(axis=0)), axis=1)
+
+            qp.pruned_mass = self.pruned_mass + self.posterior[outside].sum()
+            qp.set_pruning(self.prune_threshold, self.prune_max_mass)
+            qp.prune()
+
+        return qp
+
+    def dumps_state(self, dtype='float64', log_space=False):
+        '''Get compact state: posterior and histories (domains and likelihoods are not included).
+
+        dtype     - dtype of the stored posterior: 'float64' or 'float32'
+        log_space - store the log of the posterior (keeps small probabilities
+                    with 'float32')
+        '''
+        dtype_code = [k for k, v in state_dtypes.items() if v == np.dtype(dtype)]
+        if len(dtype_code) == 0:
+            raise ValueError(f'Unsupported posterior dtype: {dtype}')
+
+        posterior = self.posterior
+        if log_space:
+            with np.errstate(divide='ignore'):
+                posterior = np.log(posterior)
+
+        header = state_headers[state_version].pack(
+            state_magic, state_version, state_log_space if log_space else 0,
+            dtype_code[0], posterior.shape[0], len(self.stim_history),
+            getattr(self, 'pruned_mass', 0.))
+
+        return b''.join([
+            header,
+            posterior.astype(state_dtypes[dtype_code[0]]).tobytes(),
+            np.asarray(self.stim_history, '<f8').tobytes(),
+            np.asarray(self.resp_history, 'int8').tobytes()
+        ])
+
+    def loads_state(self, data):
+        '''Restore posterior and histories from compact state (see `dumps_state`).'''
+        data = bytes(data)
+
+        version = data[len(state_magic)]
+
+        if version not in state_headers:
+            raise ValueError(f'Unsupported QuestPlus state version: {version}')
+
+        header = state_headers[version].unpack_from(data)
+        _, _, flags, dtype_code, n_param, n_history = header[:6]
+        self.pruned_mass = header[6] if version >= 2 else 0.
+
+        if n_param != self.param_domain.shape[0]:
+            raise ValueError(f'QuestPlus state does not match parameters domain: '
+                             f'{n_param} != {self.param_domain.shape[0]}')
+
+        dtype = state_dtypes[dtype_code]
+        offset = state_headers[version].size
+
+        posterior = np.frombuffer(data, dtype, n_param, offset).astype('float64')
+        offset += n_param * dtype.itemsize
+
+        if flags & state_log_space:
+            posterior = np.exp(posterior)
+
+        # renormalize (posterior may have been stored with lower precision)
+        self.posterior = posterior / posterior.sum()
+
+        stim_history = np.frombuffer(data, '<f8', n_history, offset)
+        offset += n_history * 8
+        resp_history = np.frombuffer(data, 'int8', n_history, offset)
+
+        self.stim_history = stim_history.tolist()
+        self.resp_history = resp_history.tolist()
+
+        # dropped cells of sparse mode
+        if self.prune_threshold is not None:
+            self._set_active(np.flatnonzero(self.posterior > 0))
+
+    @classmethod
+    def from_binary(cls, data, stim, params, function, max_bytes=None):
+        '''Get QuestPlus instance from binary data: compact state or legacy
+        pickle of the whole instance.'''
+        if not is_state(data):
+            return pickle.loads(data)
+
+        qp = cls(stim, params, function=function, max_bytes=max_bytes)
+        qp.loads_state(data)
+        return qp
 
     def plot(self):
         '''Plot posterior model parameter probabilities and weibull fits.'''
         pass
         # TODO : implement this method
         # return plot_quest_plus(self)
+
+
+class QuestPlusBatch(object):
+    '''Several QUEST+ procedures (i.e. participants) sharing the same stim
+    domain, parameters domain and psychometric function.
+
+    Posteriors are stored as a (n_procedures, n_param) array and all
+    procedures are updated and advanced with vectorised operations over the
+    shared likelihood table.'''
+
+    def __init__(self, stim, params, function, n_procedures):
+        self.function = function
+        self.stim_domain = stim
+        self.param_domain = reformat_params(params)
+
+        n_stim, n_param = self.stim_domain.shape[0], self.param_domain.shape[0]
+
+        self.likelihoods = likelihood_cache.get(self.stim_domain,
+                                                self.param_domain,
+                                                self.function)
+        self._entropy_tables = likelihood_cache.get_entropy_tables(
+            self.stim_domain, self.param_domain, self.function)
+
+        self._stim_index = StimIndex(self.stim_domain)
+
+        # flat prior for all procedures
+        self.posteriors = np.full((n_procedures, n_param), 1. / n_param)
+        self.n_trials = np.zeros(n_procedures, 'int64')
+        self.entropy = np.ones((n_procedures, n_stim))
+
+    @property
+    def n_procedures(self):
+        return self.posteriors.shape[0]
+
+    @classmethod
+    def from_instances(cls, instances):
+        '''Create batch from QuestPlus instances with the same domains and
+        function (posteriors are copied).'''
+        first = instances[0]
+        batch = cls(first.stim_domain, first._orig_params, first.function,
+                    len(instances))
+
+        for i, qp in enumerate(instances):
+            batch.posteriors[i] = qp.posterior
+            batch.n_trials[i] = len(qp.stim_history)
+
+        return batch
+
+    def stim_index(self, contrasts, approximate=True):
+        '''Get index of each contrast into the stim domain.'''
+        return self._stim_index.find(contrasts, approximate=approximate)
+
+    def update_many(self, stim_idx, responses, rows=None):
+        '''Update posteriors with outcome of current trial of each procedure.
+
+        stim_idx  - index of presented stim for each procedure
+        responses - 1 (correct) or 0 (incorrect) for each procedure
+        rows      - procedures to update (all procedures by default)
+        '''
+        if rows is None:
+            rows = np.arange(self.n_procedures)
+
+        stim_idx = np.asarray(stim_idx, 'int64')
+        resp_idx = 1 - np.asarray(responses, 'int64')
+
+        # (n_rows, n_param) likelihoods of the given responses
+        likelihood = self.likelihoods[stim_idx, :, resp_idx]
+
+        posteriors = self.posteriors[rows] * likelihood
+        posteriors /= posteriors.sum(axis=1, keepdims=True)
+
+        self.posteriors[rows] = posteriors
+        self.n_trials[rows] += 1
+
+    def get_entropy_many(self):
+        '''Compute expected entropy of each stim for all procedures (same
+        fused formulation as `QuestPlus.fused_entropy`).
+
+        Returns
+        -------
+        entropy : (n_procedures, n_stim) expected entropies.'''
+        lk, lk_log = self._entropy_tables
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            post_log = np.where(self.posteriors > 0,
+                                self.posteriors * np.log(self.posteriors), 0.)
+
+        # (n_procedures, n_stim * 2)
+        norm = self.posteriors @ lk.T
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            joint = np.where(norm > 0, norm * np.log(norm), 0.)
+
+        joint -= self.posteriors @ lk_log.T
+        joint -= post_log @ lk.T
+
+        self.entropy = joint.reshape(self.n_procedures, -1, 2).sum(axis=2)
+        return self.entropy
+
+    def next_many(self):
+        '''Get next stim of each procedure (minimal expected entropy).
+
+        Returns
+        -------
+        stim_idx : index of next stim into stim domain for each procedure.
+        entropy : minimal expected entropy of each procedure.'''
+        entropy = self.get_entropy_many()
+        stim_idx = entropy.argmin(axis=1)
+
+        return stim_idx, entropy[np.arange(self.n_procedures), stim_idx]
+
+    def fit_counts(self, counts, rows=None):
+        '''Update posteriors of procedures with histories collapsed into
+        (stim, response) counts (see `QuestPlus.history_counts`): one product
+        of all counts with the log-likelihoods table.
+
+        counts - (n_rows, n_stim, 2) counts of (correct, incorrect) responses
+        rows   - procedures to update (all procedures by default)
+        '''
+        if rows is None:
+            rows = np.arange(self.n_procedures)
+
+        counts = np.asarray(counts, 'float64')
+        log_lk = likelihood_cache.get_log_likelihoods(
+            self.stim_domain, self.param_domain, self.function)
+
+        with np.errstate(divide='ignore'):
+            log_posteriors = np.log(self.posteriors[rows])
+
+        log_posteriors += counts.reshape(len(rows), -1) @ log_lk
+
+        log_posteriors -= log_posteriors.max(axis=1, keepdims=True)
+        posteriors = np.exp(log_posteriors)
+        posteriors /= posteriors.sum(axis=1, keepdims=True)
+
+        self.posteriors[rows] = posteriors
+        self.n_trials[rows] += counts.reshape(len(rows), -1).sum(axis=1).astype('int64')
+
+    def get_fit_params_many(self, select='mode'):
+        '''Get fitted parameters of each procedure: (n_procedures, n_dims).'''
+        if select in ['max', 'mode']:
+            return self.param_domain[self.posteriors.argmax(axis=1), :]
+        elif select == 'mean':
+            return self.posteriors @ self.param_domain
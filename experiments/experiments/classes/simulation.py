@@ -0,0 +1,128 @@
+import time
+import tracemalloc
+
+import numpy as np
+
+from .quest_plus import QuestPlus, QuestPlusBatch, psychometric_fun
+
+
+class SimulatedObserver(object):
+    '''Synthetic participant answering with a known psychometric function.
+
+    params   - ground truth parameters of the function (e.g. threshold, slope)
+    function - psychometric function giving probability of correct answer
+    '''
+
+    def __init__(self, params, function=psychometric_fun, rng=None):
+        self.params = np.asarray(params)
+        self.function = function
+        self.rng = np.random.default_rng() if rng is None else rng
+
+    def probability(self, stim):
+        return self.function(np.atleast_1d(stim), self.params)
+
+    def respond(self, stim):
+        '''Get simulated answer: 1 (correct) or 0 (incorrect).'''
+        return int(self.rng.random() < self.probability(stim)[0])
+
+
+def sample_params(params, n, rng):
+    '''Draw ground truth parameters uniformly into the range of each
+    parameter domain: (n, n_dims) array.'''
+    return np.stack([rng.uniform(np.min(domain), np.max(domain), n)
+                     for domain in params], axis=1)
+
+
+def simulate(stim, params, n_sessions, n_trials, function=psychometric_fun,
+             true_params=None, batch=False, seed=None):
+    '''Run full adaptive procedures with simulated observers.
+
+    stim        - stim domain
+    params      - list of parameters domains
+    n_sessions  - number of simulated participants
+    n_trials    - number of trials of each participant
+    true_params - (n_sessions, n_dims) ground truth parameters (drawn into
+                  parameters domains if not specified)
+    batch       - use QuestPlusBatch engine instead of one QuestPlus by
+                  participant
+
+    Timings are given by session and by call (a batch call advances all
+    sessions), memory is given by session: both are comparable between the
+    two engines.
+
+    Returns
+    -------
+    results : dict with timings, memory and fitted parameters.'''
+    rng = np.random.default_rng(seed)
+
+    if true_params is None:
+        true_params = sample_params(params, n_sessions, rng)
+
+    observers = [SimulatedObserver(p, function, rng) for p in true_params]
+
+    update_time = 0.
+    next_time = 0.
+
+    # memory of participants states only: shared tables (likelihoods and
+    # entropy tables) are built before, both engines measure their construction
+    QuestPlus(stim, params, function).next_contrast()
+    tracemalloc.start()
+    start_memory = tracemalloc.get_traced_memory()[0]
+
+    if batch:
+        engine = QuestPlusBatch(stim, params, function, n_sessions)
+    else:
+        engines = [QuestPlus(stim, params, function) for _ in range(n_sessions)]
+
+    session_memory = (tracemalloc.get_traced_memory()[0] - start_memory) / n_sessions
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+
+    if batch:
+
+        for _ in range(n_trials):
+            t = time.perf_counter()
+            stim_idx, _ = engine.next_many()
+            next_time += time.perf_counter() - t
+
+            responses = [observer.respond(engine.stim_domain[idx])
+                         for observer, idx in zip(observers, stim_idx)]
+
+            t = time.perf_counter()
+            engine.update_many(stim_idx, responses)
+            update_time += time.perf_counter() - t
+
+        fit_params = engine.get_fit_params_many()
+        state_bytes = engine.posteriors[0].nbytes
+    else:
+        for qp, observer in zip(engines, observers):
+            for _ in range(n_trials):
+                t = time.perf_counter()
+                next_stim = qp.next_contrast()
+                next_time += time.perf_counter() - t
+
+                response = observer.respond(next_stim)
+
+                t = time.perf_counter()
+                qp.update(next_stim, response)
+                update_time += time.perf_counter() - t
+
+        fit_params = np.array([qp.get_fit_params() for qp in engines])
+        state_bytes = len(engines[0].dumps_state())
+
+    elapsed = time.perf_counter() - start
+    n_steps = n_sessions * n_trials
+
+    return {
+        'sessions': n_sessions,
+        'trials': n_trials,
+        'steps_per_sec': n_steps / elapsed,
+        'update_time': update_time / n_steps,
+        'next_time': next_time / n_steps,
+        'session_memory': session_memory,
+        'state_bytes': state_bytes,
+        'true_params': true_params,
+        'fit_params': fit_params,
+        'errors': fit_params - true_params,
+    }
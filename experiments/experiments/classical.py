@@ -2,6 +2,7 @@ import os
 import random
 import time
 from ..models import SessionProgress, Session
+from ..datasets import get_manifest
 from django.conf import settings
 
 class ClassicalSessionProgress(SessionProgress):
@@ -48,11 +49,9 @@ class ClassicalSessionProgress(SessionProgress):
 
         # folder of images could also stored into experiment config
         cornel_box_path = 'resources/images/cornel_box'
-        # need to take care of static media folder
-        images_path = sorted([ 
-                    os.path.join(cornel_box_path, img) 
-                    for img in os.listdir(os.path.join(settings.RELATIVE_STATIC_URL, cornel_box_path)) 
-                ])
+        # need to take care of static media folder (folder content is indexed once)
+        manifest = get_manifest(os.path.join(settings.RELATIVE_STATIC_URL, cornel_box_path))
+        images_path = [ os.path.join(cornel_box_path, img) for img in manifest.files ]
 
         # right image always display reference
         # prepare next step data
@@ -1,9 +1,12 @@
 import os
 import random
 import time
-import numpy as np
-from PIL import Image, ImageDraw
 from ..models import SessionProgress
+from ..artifacts import inputs_key, artifact_url, get_artifact_store
+from ..encoders import get_encoder
+from ..datasets import get_manifest
+from ..rendering import render_block_images, render_version
+from ..workers import pixel_pool
 from django.conf import settings
 
 
@@ -12,7 +15,6 @@ class Point():
     def __init__(self, x, y):
         self._x = x
         self._y = y
-        # self.padding_removed = False
 
     @property
     def x(self):
@@ -30,25 +32,6 @@ class Point():
     def set_y(self, y):
         self._y = y
 
-    def remove_padding(self, padding):
-        
-        x = None
-        y = None
-
-        #if not self.padding_removed:
-        x = self._x - padding
-        y = self._y - padding
-
-        # avoid issue later with numpy index access
-        if x < 0:
-            x = 0
-
-        if y < 0:
-            y = 0
-
-        #self.padding_removed = True
-        return Point(x, y)
-
     def __str__(self) -> str:
         return f'({self._x}, {self._y})'
 
@@ -75,16 +58,93 @@ class OneBlockSessionProgress(SessionProgress):
 
         return l1, l2
     
-    def add_red_box(self, image, points):
-        
-        padding = self.session.config['padding']
-        l1, l2 = points
-        shape = [(l1.x - padding * 2, l1.y - padding * 2), (l2.x, l2.y)]
+    def get_images_source(self):
+        """
+        Get source of the dataset images depending of experiment config: memory-mapped pack
+        (`dataset_pack`), tiled dataset (`dataset_tiles`) or images folder
+
+        Return: (kind, folder) tuple
+        """
+        config = self.session.experiment.config
 
-        image_draw = ImageDraw.Draw(image)  
-        image_draw.rectangle(shape, outline ="red", width=3)
+        if config.get('dataset_pack') is not None:
+            return ('pack', config['dataset_pack'])
 
-        return image
+        if config.get('dataset_tiles') is not None:
+            return ('tiles', config['dataset_tiles'])
+
+        return ('images', None)
+
+    def get_render_keys(self, encoder):
+        """
+        Get artifact keys of block image and reference image from their inputs
+
+        Return: (block image key, reference image key) tuple
+        """
+        dataset_path = self.session.experiment.config['dataset']
+        manifest = get_manifest(os.path.join(settings.RELATIVE_STATIC_URL, dataset_path))
+
+        # reference image with red box only depends on scene and block
+        reference_inputs = {
+            'render': 'one_block',
+            'render_version': render_version,
+            'dataset': dataset_path,
+            'dataset_version': manifest.scene(self.data['selected_scene']).version,
+            'scene': self.data['selected_scene'],
+            'selected_block': self.data['selected_block'],
+            'padding': self.session.config['padding'],
+            'encoder': str(encoder)
+        }
+
+        block_inputs = dict(reference_inputs, selected_index=self.data['selected_index'])
+
+        return inputs_key(block_inputs, encoder.extension), inputs_key(reference_inputs, encoder.extension)
+
+    def render_block_images(self, images_path):
+        """
+        Compose block image (spp level block into reference) and reference image, both with red boxes
+
+        Return: dict with left and right images data
+        """
+
+        encoder = get_encoder(self.session.config)
+        store = get_artifact_store()
+
+        # renders are keyed by their inputs: same trial of another participant is never rendered again
+        left_key, right_key = self.get_render_keys(encoder)
+
+        if not (store.contains(left_key) and store.contains(right_key)):
+
+            # pixel work is done into the pixel pool if enabled (inline otherwise)
+            encoded_left, encoded_right = pixel_pool.run(render_block_images,
+                self.get_images_source(),
+                self.data['selected_scene'],
+                [ os.path.join(settings.RELATIVE_STATIC_URL, img) for img in images_path ],
+                self.data['selected_index'],
+                self.data['selected_block'],
+                self.session.config['padding'],
+                encoder)
+
+            store.put(left_key, encoded_left)
+            store.put(right_key, encoded_right)
+
+        # generated images are served from artifact store (immutable urls)
+        output_image_left = artifact_url(left_key)
+        output_image_right = artifact_url(right_key)
+
+        # right image always display reference
+        return {
+            "left_image": {
+                "src": output_image_left,
+                "width": 500,
+                "height": 500
+            },
+            "right_image": {
+                "src": output_image_right,
+                "width": 500,
+                "height": 500
+            }
+        }
 
     def start(self, participant_data):
         """
@@ -103,8 +163,9 @@ class OneBlockSessionProgress(SessionProgress):
         }
 
         dataset_path = self.session.experiment.config['dataset']
+        manifest = get_manifest(os.path.join(settings.RELATIVE_STATIC_URL, dataset_path))
 
-        scenes_path = os.listdir(os.path.join(settings.RELATIVE_STATIC_URL, dataset_path))
+        scenes_path = list(manifest.folders)
         first_scene = random.choice(scenes_path)
 
         # initialize first scene, selected and done
@@ -112,7 +173,7 @@ class OneBlockSessionProgress(SessionProgress):
         self.data['scenes'] = scenes_path
         self.data['scenes_done'] = []
 
-        n_images = len(os.listdir(os.path.join(settings.RELATIVE_STATIC_URL, dataset_path, first_scene)))
+        n_images = manifest.n_images(first_scene)
         self.data['selected_index'] = n_images - 1
 
         # get block information
@@ -129,7 +190,7 @@ class OneBlockSessionProgress(SessionProgress):
         Return: JSON data object
         """
 
-        dataset_path = self.session.experiment.config['dataset']
+        answer_value = None
 
         # 1. update previous step depending of answer (if previous step exists)
         if step is not None:
@@ -140,6 +201,33 @@ class OneBlockSessionProgress(SessionProgress):
             step.data['answer_value'] = answer_value
             step.save()
 
+        # 2. process next step data (candidate may have been computed during previous step)
+        step_data = self.speculative_advance(step.data if step is not None else None, answer_value)
+
+        # end of the experiment all scenes done
+        if step_data is None:
+            return None
+
+        # always save state
+        self.save()
+
+        # prepare the next step of each possible answer while participant is answering
+        self.speculate(step_data)
+
+        return step_data
+
+    def advance(self, step_data, answer_value) -> dict:
+        """
+        Update progress data depending of the answer and define next step data (no database access)
+
+        Return: JSON data object (None if all scenes are done)
+        """
+
+        dataset_path = self.session.experiment.config['dataset']
+        manifest = get_manifest(os.path.join(settings.RELATIVE_STATIC_URL, dataset_path))
+
+        if answer_value is not None:
+
             # update answer
             if int(self.data['iteration']) > 0 and int(answer_value) == 1:
                 self.data['selected_index'] = int(self.data['selected_index'] / 2)
@@ -164,7 +252,7 @@ class OneBlockSessionProgress(SessionProgress):
                 self.data['selected_scene'] = random.choice([s for s in self.data['scenes'] if s not in self.data['scenes_done'] ])
 
                 # define new block
-                n_images = len(os.listdir(os.path.join(settings.RELATIVE_STATIC_URL, dataset_path, self.data['selected_scene'])))
+                n_images = manifest.n_images(self.data['selected_scene'])
                 self.data['selected_index'] = n_images - 1
 
                 # get new block information
@@ -174,80 +262,42 @@ class OneBlockSessionProgress(SessionProgress):
         # folder of images could also stored into experiment config
         scene_path = os.path.join(dataset_path, self.data['selected_scene'])
 
-        # need to take care of static media folder
-        images_path = sorted([ 
+        # need to take care of static media folder (scene content is indexed once)
+        images_path = [ 
                     os.path.join(scene_path, img) 
-                    for img in os.listdir(os.path.join(settings.RELATIVE_STATIC_URL, scene_path)) 
-                ])
-
-        # get reference image
-        ref_image = np.array(Image.open(os.path.join(settings.RELATIVE_STATIC_URL, images_path[-1])))
-        reconstructed_image = np.copy(ref_image)
-
-        # get spp level image
-        spp_level_image = np.array(Image.open(os.path.join(os.path.join(settings.RELATIVE_STATIC_URL, images_path[self.data['selected_index']]))))
-
-        x1, y1, x2, y2 = self.data['selected_block']
-
-        p1 = Point(x1, y1)
-        p2 = Point(x2, y2)
-
-        # replace block with spp
-        p1 = p1.remove_padding(self.session.config['padding'])
-        p2 = p2.remove_padding(self.session.config['padding'])
-
-        reconstructed_image[p1.y:p2.y, p1.x:p2.x] = spp_level_image[p1.y:p2.y, p1.x:p2.x]
-
-        # redifined selected block without padding removed
-        x1, y1, x2, y2 = self.data['selected_block']
-
-        p1 = Point(x1, y1)
-        p2 = Point(x2, y2)
-
-        # add red boxes
-        reconstructed_pil_image = Image.fromarray(np.array(reconstructed_image, 'uint8'))
-        reconstructed_pil_image = self.add_red_box(reconstructed_pil_image, (p1, p2))
-
-        ref_pil_image = Image.fromarray(np.array(ref_image, 'uint8'))
-        ref_pil_image = self.add_red_box(ref_pil_image, (p1, p2))
-        
-        # save generated image into static folder (need the access of the new image)
-        generated_path = os.path.join(settings.RELATIVE_STATIC_URL, 'generated')
-
-        if not os.path.exists(generated_path):
-            os.makedirs(generated_path)
-
-        output_image_path_left = os.path.join(generated_path, f'{self.participant.id}_left.png')
-        reconstructed_pil_image.save(output_image_path_left)
-
-        output_image_right = os.path.join(generated_path, f'{self.participant.id}_right.png')
-        ref_pil_image.save(output_image_right)
-
-        # right image always display reference
-        # prepare next step data
-        step_data = {
-            "left_image": {
-                "src": f"{output_image_path_left.replace(settings.RELATIVE_STATIC_URL, '')}",
-                "width": 500,
-                "height": 500
-            },
-            "right_image": {
-                "src": f"{output_image_right.replace(settings.RELATIVE_STATIC_URL, '')}",
-                "width": 500,
-                "height": 500
-            },
+                    for img in manifest.scene(self.data['selected_scene']).files
+                ]
+
+        # client side compositing: the browser composes stimuli from the source images
+        if self.session.config.get('compositing', 'server') == 'client':
+
+            # STATIC_URL should never be included into image path for template
+            step_data = {
+                "reference_image": {
+                    "src": images_path[-1],
+                    "width": 500,
+                    "height": 500
+                },
+                "block_image": {
+                    "src": images_path[self.data['selected_index']],
+                    "width": 500,
+                    "height": 500
+                },
+                "padding": self.session.config['padding']
+            }
+        else:
+            step_data = self.render_block_images(images_path)
+
+        step_data.update({
             "scene": self.data['selected_scene'],
             "image_index": self.data['selected_index'],
             "selected_block": self.data['selected_block'],
             "iteration": self.data['iteration']
-        }
+        })
 
         # increment iteration into progress data
         self.data['iteration'] += 1
 
-        # always save state
-        self.save()
-
         return step_data
 
     def progress(self) -> float:
@@ -1,29 +1,177 @@
 import os, sys
-import random
+import threading
 import numpy as np
-from PIL import Image
 from ..models import SessionProgress, SessionStep
+from ..artifacts import artifact_key, artifact_url, get_artifact_store
+from ..encoders import get_encoder
+from ..datasets import get_manifest
+from ..rendering import render_quest_composite
+from ..workers import pixel_pool
 from django.conf import settings
-import pickle
+from django.contrib.contenttypes.models import ContentType
 
 # include specific requirements for Quest
-from .classes.quest_plus import QuestPlus
-from .classes.quest_plus import psychometric_fun
+from .classes.quest_plus import QuestPlus, QuestPlusBatch, refine_axis
+from .classes.quest_plus import likelihood_cache
+from .classes.psychometric import get_psychometric_function
 
-def get_nsamples_image(filename):
-    """Specific method in order to get number of samples of image
+# likelihood tables can be mapped by all server processes
+likelihood_cache.shared_memory = getattr(settings, 'QUEST_LIKELIHOODS_SHARED_MEMORY', False)
+likelihood_cache.max_bytes = getattr(settings, 'QUEST_LIKELIHOODS_CACHE_MAX_BYTES', 512 * 1024 * 1024)
+
+
+class QuestCompositeBank():
+    """
+    Composited stimuli of a Quest dataset, one ready-made image for each stim level
+
+    The composited image only depends on the stim level (bottom right quadrant is
+    always the reference), hence images are built once and shared by all participants.
+    """
+
+    def __init__(self, manifest, encoder):
+        self.manifest = manifest
+        self.encoder = encoder
+        self.images = {}
+
+    def build(self):
+        """
+        Build and encode composited image of each stim level (content-addressed keys)
+        """
+        images_folder = self.manifest.folder
+        levels = list(self.manifest.spp_levels.items())
+
+        # reference is the last image (highest number of samples), levels are composited into the pixel pool
+        encoded_images = pixel_pool.run_many(render_quest_composite,
+            [ (images_folder, self.manifest.files[-1], image_path, self.encoder) for _, image_path in levels ])
+
+        for (nsamples, _), image_bytes in zip(levels, encoded_images):
+
+            # same content always leads to same key (and same url)
+            key = artifact_key(image_bytes, self.encoder.extension)
+            self.images[nsamples] = (key, image_bytes)
+
+    def get(self, stim):
+        """
+        Get url of composited image of expected stim level
+        """
+        key, image_bytes = self.images[int(stim)]
+
+        # artifact may have been evicted from the store
+        store = get_artifact_store()
+
+        if not store.contains(key):
+            store.put(key, image_bytes)
+
+        return artifact_url(key)
+
+
+_composite_banks = {}
+_composite_banks_lock = threading.Lock()
+
+def get_composite_bank(dataset_path, encoder):
+    """Get (and build on first use) the composite bank of a Quest dataset
     Args:
-        filename ([str]): filename on expected image 
+        dataset_path ([str]): dataset folder relative to static folder
+        encoder ([ImageEncoder]): encoder used for composited images
     Returns:
-        [int]: number of samples
+        [QuestCompositeBank]: bank shared by all participants
     """
-    return int(filename.split('_')[-1].replace('.png', ''))
+    # rebuild the bank if dataset folder has been modified (new manifest)
+    manifest = get_manifest(os.path.join(settings.RELATIVE_STATIC_URL, dataset_path))
+
+    key = (dataset_path, str(encoder))
+
+    with _composite_banks_lock:
+        bank = _composite_banks.get(key)
+
+        if bank is None or bank.manifest is not manifest:
+            bank = QuestCompositeBank(manifest, encoder)
+            bank.build()
+            _composite_banks[key] = bank
+
+    return bank
 
 class QuestSessionProgress(SessionProgress):
     """
     Example of Quest experiment with specific number of iteration
     """    
     
+    def get_quest(self):
+        """
+        Get Quest+ instance of the participant: domains are rebuilt from progress data
+        and participant state is loaded from binary data (legacy pickle is also supported)
+        Sparse mode is enabled if `quest_pruning` is defined into session config
+        Psychometric function can be selected with `quest_function` into session config
+
+        Return: QuestPlus instance
+        """
+        stim = np.array(self.data['stim'], 'int32')
+        slopes = np.array(self.data['slopes'], 'float32')
+
+        function = get_psychometric_function(self.session.config)
+
+        qp = QuestPlus.from_binary(self.binary, stim, [stim, slopes], function=function,
+                                   max_bytes=getattr(settings, 'QUEST_LIKELIHOODS_MAX_BYTES', None))
+
+        # sparse mode: `"quest_pruning": {"threshold": 1e-8, "max_mass": 1e-4}`
+        pruning_config = (self.session.config or {}).get('quest_pruning')
+
+        if pruning_config is not None:
+            qp.set_pruning(pruning_config['threshold'], pruning_config['max_mass'])
+
+        return qp
+
+    def save_quest(self, qp):
+        """
+        Store compact state of Quest+ instance into binary data, the posterior precision
+        can be defined into session config: `"quest_state": {"dtype": "float32", "log_space": true}`
+        """
+        state_config = (self.session.config or {}).get('quest_state', {})
+
+        self.binary = qp.dumps_state(dtype=state_config.get('dtype', 'float64'),
+                                     log_space=state_config.get('log_space', False))
+
+    def refine_quest(self, qp, entropy):
+        """
+        Multi-resolution mode (`quest_multiresolution` into session config): when entropy is
+        under the next threshold, stim and parameters steps are halved into a window of the
+        same size centered on the posterior mode (posterior is projected onto the new grid)
+
+        Usage example into Session config:
+            "quest_multiresolution": {"step": 4, "entropy": [4.5, 4.0]}
+
+        Return: refined Quest+ instance (or same instance)
+        """
+        config = (self.session.config or {}).get('quest_multiresolution')
+
+        if config is None or 'resolution' not in self.data:
+            return qp
+
+        level = self.data['resolution']
+        thresholds = config['entropy']
+
+        if level >= len(thresholds) or entropy >= thresholds[level] or self.data['step'] <= 1:
+            return qp
+
+        full_stim = np.array(self.data['full_stim'], 'int32')
+        full_slopes = np.array(self.data['full_slopes'], 'float32')
+
+        # same number of cells as the coarse grid
+        step = max(self.data['step'] // 2, 1)
+        threshold, slope = qp.get_fit_params(select='mode')[:2]
+
+        stim = refine_axis(full_stim, step, threshold, len(full_stim[::int(config['step'])]))
+        slopes = refine_axis(full_slopes, step, slope, len(full_slopes[::int(config['step'])]))
+
+        qp = qp.refine(stim, [stim, slopes], max_bytes=getattr(settings, 'QUEST_LIKELIHOODS_MAX_BYTES', None))
+
+        self.data['stim'] = list([ float(s) for s in stim ])
+        self.data['slopes'] = list([ float(s) for s in slopes ])
+        self.data['step'] = step
+        self.data['resolution'] = level + 1
+
+        return qp
+
     def start(self, participant_data):
         """
         Define and init some progress variables
@@ -43,17 +191,28 @@ class QuestSessionProgress(SessionProgress):
         slopes = np.arange(0.0001, 0.001, 0.00003, 'float32')
         stim = np.arange(500, 10500, 500, 'int32')
 
+        # multi-resolution: start on a coarse grid (full resolution domains are kept)
+        multiresolution_config = (self.session.config or {}).get('quest_multiresolution')
+
+        if multiresolution_config is not None:
+            self.data['full_slopes'] = list([ float(s) for s in slopes ])
+            self.data['full_stim'] = list([ float(s) for s in stim ])
+            self.data['resolution'] = 0
+            self.data['step'] = int(multiresolution_config['step'])
+
+            slopes = slopes[::self.data['step']]
+            stim = stim[::self.data['step']]
+
         # need basic types
         self.data['slopes'] = list([ float(s) for s in slopes ])
         self.data['stim'] = list([ float(s) for s in stim ]) # 10500 because we need 10000 too
 
         # initialization of Quest plus instance (require numpy array)
         qp = QuestPlus(stim, [stim, slopes], 
-                        function=psychometric_fun)
+                        function=get_psychometric_function(self.session.config))
 
-        # store participant quest binary data
-        qp_bytes = pickle.dumps(qp)
-        self.binary = qp_bytes
+        # store participant quest binary data (compact state)
+        self.save_quest(qp)
 
         # always save state
         self.save()
@@ -64,12 +223,7 @@ class QuestSessionProgress(SessionProgress):
 
         Return: JSON data object
         """
-        # load Quest plus instance
-        qp = pickle.loads(self.binary)
-
-        # Initialize and get experiment configuration parameters
-        entropy = sys.float_info.max
-        previous_entropy = None
+        answer_value = None
 
         # 1. update previous step depending of answer (if previous step exists)
         if step is not None:
@@ -78,18 +232,52 @@ class QuestSessionProgress(SessionProgress):
             
             step.data['answer_time'] = answer_time
             step.data['answer_value'] = answer_value
-            step.save()
+            step.save(update_fields=['data'])
+
+        # 2. process next step data (candidate may have been computed during previous step)
+        step_data = self.speculative_advance(step.data if step is not None else None, answer_value)
+
+        # always save state (only progress table is updated)
+        self.save(update_fields=['is_started', 'data', 'binary'])
+
+        # prepare the next step of each possible answer while participant is answering
+        self.speculate(step_data)
+
+        return step_data
+
+    def advance(self, step_data, answer_value) -> dict:
+        """
+        Update Quest+ model with the answer of previous step and define next step data (no database access)
+
+        Return: JSON data object
+        """
+        # load Quest plus instance
+        qp = self.get_quest()
+
+        # Initialize and get experiment configuration parameters
+        entropy = sys.float_info.max
+        previous_entropy = None
+        best_stim = None
+
+        if step_data is not None:
 
             # update quest plus
-            previous_entropy = step.data['entropy']
-            previous_stim = step.data['stim']
+            previous_entropy = step_data['entropy']
+            previous_stim = step_data['stim']
 
             qp.update(int(previous_stim), answer_value) 
 
             threshold = qp.get_fit_params(select='mode')[0]
         
-            # get new entropy
-            entropy = qp.get_entropy()
+            # get new entropy and stim minimizing it (single pass)
+            entropy, best_stim = qp.fused_entropy()
+
+            # multi-resolution: finer domains once entropy is low enough
+            refined_qp = self.refine_quest(qp, entropy)
+
+            if refined_qp is not qp:
+                qp = refined_qp
+                entropy, best_stim = qp.fused_entropy()
             print(f'Quest+ model updated: current entropy {entropy}')
         
         # 2. process next step data (can be depending of answer)
@@ -97,11 +285,8 @@ class QuestSessionProgress(SessionProgress):
         # folder of images could also stored into experiment config
         cornel_box_path = 'resources/images/cornel_box'
 
-        # need to take care of static media folder
-        images_path = sorted([ 
-                    os.path.join(cornel_box_path, img) 
-                    for img in os.listdir(os.path.join(settings.RELATIVE_STATIC_URL, cornel_box_path)) 
-                ])
+        # composited images are prepared once for all participants
+        composite_bank = get_composite_bank(cornel_box_path, get_encoder(self.session.config))
 
         # right image always display reference
         # prepare next step data
@@ -110,45 +295,23 @@ class QuestSessionProgress(SessionProgress):
 
             next_stim_id = int(self.data['iteration'] * len(self.data['stim'])/10)
             next_stim = self.data['stim'][next_stim_id]
+        elif best_stim is not None:
+            next_stim = best_stim
         else:
             next_stim = qp.next_contrast()
 
-        # get the selected image path
-        selected_image_path = [ img for img in os.listdir(os.path.join(settings.RELATIVE_STATIC_URL, cornel_box_path)) \
-            if get_nsamples_image(img) == next_stim ][0]
-
-        # reconstruct image
-        # STATIC_URL should never be included in image path for template
-        current_image = np.array(Image.open(os.path.join(settings.RELATIVE_STATIC_URL, cornel_box_path, selected_image_path)))
-        ref_image = np.array(Image.open(os.path.join(settings.RELATIVE_STATIC_URL, images_path[-1])))
-
-        h, w, _ = current_image.shape
-
-        # here static merge
-        current_image[int(h/2):h, int(w/2):w, :] = ref_image[int(h/2):h, int(w/2):w, :]
-
-        # save generated image into static folder (need the access of the new image)
-        generated_path = os.path.join(settings.RELATIVE_STATIC_URL, 'generated')
-
-        if not os.path.exists(generated_path):
-            os.makedirs(generated_path)
-
-        output_image_path = os.path.join(generated_path, f'{self.participant.id}.png')
-        Image.fromarray(current_image).save(output_image_path)
-
         if previous_entropy is not None:
             abs_entropy = abs(previous_entropy - entropy)
         else: 
             abs_entropy = sys.float_info.max
 
-        # STATIC_URL should never be included into image path for template
         step_data = {
             "image": {
-                "src": f"{output_image_path.replace(settings.RELATIVE_STATIC_URL, '')}",
+                "src": composite_bank.get(next_stim),
                 "width": 500,
                 "height": 500
             },
-            "stim": get_nsamples_image(selected_image_path),
+            "stim": int(next_stim),
             "entropy": entropy,
             'abs_entropy': abs_entropy # store the absolute difference entropy from last two steps
         }
@@ -157,14 +320,62 @@ class QuestSessionProgress(SessionProgress):
         self.data['iteration'] += 1
 
         # store updated participant quest binary data
-        qp_bytes = pickle.dumps(qp)
-        self.binary = qp_bytes
-
-        # always save state
-        self.save()
+        self.save_quest(qp)
 
         return step_data
 
+    @classmethod
+    def refit_session(cls, session, select='mode') -> dict:
+        """
+        Fit again Quest+ model of every progress of a session from its answered steps,
+        histories are collapsed into (stim, answer) counts and all progresses are fitted together
+
+        Return: dict of arrays: `progress` (ids), `n_trials`, `threshold` and `slope`
+        """
+        progresses = [ p for p in cls.objects.filter(session=session).order_by('id')
+                        if p.data is not None and 'stim' in p.data ]
+
+        if len(progresses) == 0:
+            return { key: np.array([]) for key in ('progress', 'n_trials', 'threshold', 'slope') }
+
+        # all progresses of a session share the same domains (full resolution ones in multi-resolution mode)
+        domains = [ (p.data.get('full_stim', p.data['stim']), p.data.get('full_slopes', p.data['slopes'])) for p in progresses ]
+
+        stim = np.array(domains[0][0], 'int32')
+        slopes = np.array(domains[0][1], 'float32')
+
+        for p, domain in zip(progresses, domains):
+            if domain != domains[0]:
+                raise ValueError(f'Progress {p.id} does not use the same Quest+ domains')
+
+        batch = QuestPlusBatch(stim, [stim, slopes], get_psychometric_function(session.config), len(progresses))
+        rows = { p.id: i for i, p in enumerate(progresses) }
+
+        # (progress, stim, answer) counts: answer index 0 is correct
+        counts = np.zeros((len(progresses), len(stim), 2))
+
+        steps = SessionStep.objects.filter(progress_type=ContentType.objects.get_for_model(cls),
+                                           progress_id__in=list(rows.keys())).values_list('progress_id', 'data')
+
+        for progress_id, data in steps:
+
+            # last step of a progress may not be answered
+            if data is None or data.get('answer_value') is None:
+                continue
+
+            stim_idx = batch.stim_index(data['stim'], approximate=False)[0]
+            counts[rows[progress_id], stim_idx, 1 - int(data['answer_value'])] += 1
+
+        batch.fit_counts(counts)
+        params = batch.get_fit_params_many(select=select)
+
+        return {
+            'progress': np.array([ p.id for p in progresses ]),
+            'n_trials': batch.n_trials,
+            'threshold': params[:, 0],
+            'slope': params[:, 1]
+        }
+
     def progress(self) -> float:
         """
         Define the percent progress of the experiment
@@ -187,9 +398,8 @@ class QuestSessionProgress(SessionProgress):
         min_iterations = int(self.session.config['min_iterations'])
         iteration = int(self.data['iteration'])
         
-        # retrieve from last step the absolute difference of entropy
-        previous_step = SessionStep.objects.filter(progress_id=self.id).latest('created_on')
-        abs_entropy = previous_step.data['abs_entropy']
+        # retrieve from last step the absolute difference of entropy (pointer, no query)
+        abs_entropy = self.current_step.data['abs_entropy']
 
         # stopping criterion based on entropy (could also be on max_time)
         return min_iterations <= iteration and (iteration >= max_iterations or abs_entropy < self.session.config['stop_entropy'])
@@ -0,0 +1,124 @@
+# main imports
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image
+from django.conf import settings
+
+
+class ImageCache():
+    """
+    Size-bounded LRU cache of decoded `uint8` images shared by all SessionProgress
+
+    Images are keyed by path and file modification time: an image updated on disk
+    is decoded again at its next access. Cached arrays are read-only as they are
+    shared between participants (use `np.copy` before any modification).
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+
+        # counters
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._images = OrderedDict()
+        self._keys = {}
+        self._lock = threading.Lock()
+
+    def get(self, image_path):
+        """
+        Get decoded image from cache (image is decoded and cached if necessary)
+
+        Return: read-only numpy array
+        """
+        image_path = os.path.abspath(image_path)
+        key = (image_path, os.stat(image_path).st_mtime_ns)
+
+        with self._lock:
+            image = self._images.get(key)
+
+            if image is not None:
+                self._images.move_to_end(key)
+                self.hits += 1
+                return image
+
+            self.misses += 1
+
+        # decode outside of the lock, other participants are not blocked
+        image = np.array(Image.open(image_path), 'uint8')
+        image.setflags(write=False)
+
+        with self._lock:
+            self._put(key, image)
+
+        return image
+
+    def _put(self, key, image):
+
+        # image too large to be cached
+        if image.nbytes > self.max_bytes:
+            return
+
+        # remove previous version of the same image (modified on disk)
+        previous_key = self._keys.get(key[0])
+
+        if previous_key is not None and previous_key in self._images:
+            self.current_bytes -= self._images.pop(previous_key).nbytes
+
+        if key not in self._images:
+            self.current_bytes += image.nbytes
+
+        self._images[key] = image
+        self._keys[key[0]] = key
+
+        # evict least recently used images
+        while self.current_bytes > self.max_bytes:
+            (path, _), evicted = self._images.popitem(last=False)
+            self._keys.pop(path, None)
+            self.current_bytes -= evicted.nbytes
+            self.evictions += 1
+
+    def clear(self):
+        """
+        Remove all cached images (counters are kept)
+        """
+        with self._lock:
+            self._images.clear()
+            self._keys.clear()
+            self.current_bytes = 0
+
+    def stats(self) -> dict:
+        """
+        Get cache usage information
+
+        Return: dict with hits, misses, evictions and memory usage
+        """
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'images': len(self._images),
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes
+            }
+
+
+# process-wide cache instance
+image_cache = ImageCache(getattr(settings, 'IMAGE_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+
+
+def load_image(image_path):
+    """Get decoded image using the process-wide image cache
+
+    Args:
+        image_path ([str]): path of the expected image
+    Returns:
+        [ndarray]: read-only `uint8` numpy array
+    """
+    return image_cache.get(image_path)
@@ -0,0 +1,62 @@
+# main imports
+import os
+import time
+
+from PIL import Image
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from experiments.encoders import ImageEncoder
+
+# encoders compared by default (format, options)
+benchmark_encoders = [
+    ('png', {'compress_level': 0}),
+    ('png', {'compress_level': 1}),
+    ('png', {'compress_level': 3}),
+    ('png', {'compress_level': 6}),
+    ('png', {'compress_level': 9}),
+    ('png', {'optimize': True}),
+    ('webp', {'method': 0, 'quality': 0}),
+    ('webp', {'method': 4, 'quality': 50}),
+    ('webp', {'method': 6, 'quality': 25}),
+    ('bmp', {}),
+]
+
+
+class Command(BaseCommand):
+    help = 'Compare encoding time and size of generated stimuli for each available encoder'
+
+    def add_arguments(self, parser):
+        parser.add_argument('images', nargs='*', type=str,
+            help='images used for the benchmark (default: Cornell box reference image)')
+        parser.add_argument('--repeat', type=int, default=5, help='number of encodings of each image')
+
+    def handle(self, *args, **options):
+
+        images_path = options['images']
+
+        if len(images_path) == 0:
+            cornel_box_path = os.path.join(settings.RELATIVE_STATIC_URL, 'resources/images/cornel_box')
+            images_path = [ os.path.join(cornel_box_path, sorted(os.listdir(cornel_box_path))[-1]) ]
+
+        images = [ Image.open(image_path).convert('RGB') for image_path in images_path ]
+        raw_bytes = sum([ image.width * image.height * 3 for image in images ])
+
+        self.stdout.write(f'Benchmark on {len(images)} image(s) ({raw_bytes} raw bytes), {options["repeat"]} encoding(s) each')
+        self.stdout.write(f'{"encoder":<55} {"ms/image":>10} {"bytes/image":>12} {"ratio":>7}')
+
+        for format, encoder_options in benchmark_encoders:
+            encoder = ImageEncoder(format, **encoder_options)
+
+            n_bytes = 0
+            start = time.perf_counter()
+
+            for _ in range(options['repeat']):
+                for image in images:
+                    n_bytes += len(encoder.encode(image))
+
+            n_encodings = options['repeat'] * len(images)
+            elapsed = (time.perf_counter() - start) / n_encodings * 1000
+            n_bytes = n_bytes / n_encodings
+
+            self.stdout.write(f'{str(encoder):<55} {elapsed:>10.2f} {int(n_bytes):>12} {n_bytes / (raw_bytes / len(images)):>7.3f}')
@@ -0,0 +1,42 @@
+# main imports
+import numpy as np
+
+from django.core.management.base import BaseCommand
+
+from experiments.experiments.classes.simulation import simulate
+
+
+class Command(BaseCommand):
+    help = 'Run Quest+ procedures with simulated observers: throughput, memory and convergence to ground truth'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sessions', type=int, default=1000, help='number of simulated participants')
+        parser.add_argument('--trials', type=int, default=30, help='number of trials of each participant')
+        parser.add_argument('--batch', action='store_true', help='advance all participants together (QuestPlusBatch)')
+        parser.add_argument('--seed', type=int, default=None, help='seed of simulated observers')
+
+    def handle(self, *args, **options):
+
+        # same domains as QuestSessionProgress
+        slopes = np.arange(0.0001, 0.001, 0.00003, 'float32')
+        stim = np.arange(500, 10500, 500, 'int32')
+
+        results = simulate(stim, [stim, slopes], options['sessions'], options['trials'],
+                           batch=options['batch'], seed=options['seed'])
+
+        engine = 'batch' if options['batch'] else 'single'
+
+        self.stdout.write(f'{results["sessions"]} session(s) of {results["trials"]} trial(s) ({engine} engine)')
+        self.stdout.write(f'steps/sec: {results["steps_per_sec"]:.1f}')
+        self.stdout.write(f'update: {results["update_time"] * 1000:.4f} ms/session/call')
+        self.stdout.write(f'next stim: {results["next_time"] * 1000:.4f} ms/session/call')
+        self.stdout.write(f'memory/session: {results["session_memory"]:.0f} bytes')
+        self.stdout.write(f'stored state: {results["state_bytes"]} bytes')
+
+        errors = np.abs(results['errors'])
+
+        for i, name in enumerate(['threshold', 'slope']):
+            truth = np.abs(results['true_params'][:, i])
+            self.stdout.write(f'{name} error: median {np.median(errors[:, i]):.6g}, '
+                              f'90th percentile {np.percentile(errors[:, i], 90):.6g} '
+                              f'(relative median {np.median(errors[:, i] / truth):.3f})')
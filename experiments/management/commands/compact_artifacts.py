@@ -0,0 +1,34 @@
+# main imports
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from experiments.artifacts import FileSystemArtifactStore
+
+
+class Command(BaseCommand):
+    help = 'Compact generated artifacts folder: shard flat files, remove expired and least recently used artifacts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-bytes', type=int, default=getattr(settings, 'ARTIFACT_FILESYSTEM_MAX_BYTES', None),
+            help='disk budget of artifacts (default: ARTIFACT_FILESYSTEM_MAX_BYTES setting)')
+        parser.add_argument('--ttl', type=int, default=getattr(settings, 'ARTIFACT_FILESYSTEM_TTL', None),
+            help='time to live in seconds since last access (default: ARTIFACT_FILESYSTEM_TTL setting)')
+        parser.add_argument('--legacy', action='store_true',
+            help='also remove expired legacy files of the folder (i.e. `<uuid>.png` images)')
+        parser.add_argument('--dry-run', action='store_true', help='only display what would be done')
+
+    def handle(self, *args, **options):
+
+        folder = os.path.join(settings.RELATIVE_STATIC_URL, 'generated')
+        store = FileSystemArtifactStore(folder)
+
+        stats = store.compact(max_bytes=options['max_bytes'], ttl=options['ttl'],
+                              legacy=options['legacy'], dry_run=options['dry_run'])
+
+        prefix = '[dry run] ' if options['dry_run'] else ''
+
+        self.stdout.write(f'{prefix}{stats["moved"]} file(s) sharded')
+        self.stdout.write(f'{prefix}{stats["removed"]} file(s) removed ({stats["removed_bytes"]} bytes)')
+        self.stdout.write(self.style.SUCCESS(f'{prefix}{stats["files"]} file(s) kept ({stats["bytes"]} bytes) into: {folder}'))
@@ -0,0 +1,33 @@
+# main imports
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from experiments.datasets import pack_dataset
+
+
+class Command(BaseCommand):
+    help = 'Convert a scenes dataset folder into a memory-mapped pack (set `dataset_pack` into experiment config to use it)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', type=str,
+            help='dataset folder relative to static folder (as `dataset` into experiment config)')
+        parser.add_argument('--output', type=str, default=None,
+            help='output folder of the pack (default: data/packs/<dataset name>)')
+
+    def handle(self, *args, **options):
+
+        dataset_folder = os.path.join(settings.RELATIVE_STATIC_URL, options['dataset'])
+        output_folder = options['output']
+
+        if output_folder is None:
+            output_folder = os.path.join(settings.OUPUT_DATA_FOLDER, 'packs', os.path.basename(os.path.normpath(options['dataset'])))
+
+        manifest = pack_dataset(dataset_folder, output_folder)
+
+        for scene, scene_data in manifest['scenes'].items():
+            self.stdout.write(f'{scene}: {scene_data["shape"]}')
+
+        self.stdout.write(self.style.SUCCESS(f'Dataset pack saved into: {output_folder}'))
+        self.stdout.write(f'Experiment config: "dataset_pack": "{output_folder}"')
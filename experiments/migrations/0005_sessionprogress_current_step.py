@@ -0,0 +1,51 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def set_current_steps(apps, schema_editor):
+    """Set current step (latest created) and number of steps of existing progresses"""
+    SessionProgress = apps.get_model('experiments', 'SessionProgress')
+    SessionStep = apps.get_model('experiments', 'SessionStep')
+
+    # progresses ids are shared by all progress classes
+    progresses = {}
+
+    steps = SessionStep.objects.order_by('progress_id', 'created_on').values_list('progress_id', 'id')
+
+    for progress_id, step_id in steps.iterator():
+        _, n_steps = progresses.get(progress_id, (None, 0))
+        progresses[progress_id] = (step_id, n_steps + 1)
+
+    updated = []
+
+    for progress in SessionProgress.objects.filter(id__in=list(progresses)).only('id'):
+        progress.current_step_id, progress.n_steps = progresses[progress.id]
+        updated.append(progress)
+
+    SessionProgress.objects.bulk_update(updated, ['current_step', 'n_steps'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('experiments', '0004_auto_20220211_1151'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sessionprogress',
+            name='current_step',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='experiments.sessionstep'),
+        ),
+        migrations.AddField(
+            model_name='sessionprogress',
+            name='n_steps',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='sessionstep',
+            index=models.Index(fields=['progress_type', 'progress_id', 'created_on'], name='experiments_step_progress_idx'),
+        ),
+        migrations.RunPython(set_current_steps, migrations.RunPython.noop),
+    ]
@@ -13,9 +13,14 @@ from django.urls import reverse
 from uuid import uuid4
 from datetime import timedelta
 import os
+import copy
+import json
+import hashlib
 from django.conf import settings
 
 from .utils import create_choice_field
+from .images import load_image
+from .speculation import speculative_steps
 from abc import abstractmethod
 
 
@@ -223,6 +228,102 @@ class SessionProgress(PolymorphicModel):
     # if necessary want to store binary data (such as python model)
     binary = models.BinaryField(null=True, blank=True)
 
+    # latest step of the progress and number of steps (avoid querying steps table)
+    current_step = models.ForeignKey('SessionStep', null=True, blank=True, editable=False,
+                                     related_name='+', on_delete=models.SET_NULL)
+    n_steps = models.PositiveIntegerField(default=0, editable=False)
+
+    def load_image(self, image_path):
+        """
+        Load decoded image using the process-wide image cache (shared between participants)
+
+        Return: read-only uint8 numpy array (copy it before any modification)
+        """
+        return load_image(image_path)
+
+    def add_step(self, step_data):
+        """
+        Create new step of the progress which becomes its current step
+
+        Return: created SessionStep
+        """
+        step = SessionStep.objects.create(progress=self, data=step_data)
+
+        self.current_step = step
+        self.n_steps += 1
+        self.save(update_fields=['current_step', 'n_steps'])
+
+        return step
+
+    @abstractmethod
+    def advance(self, step_data, answer_value) -> dict:
+        """
+        Update progress state (`data` and `binary`) depending of previous step data and answer value,
+        then define next step data (used by speculative steps, must neither access database nor save)
+
+        Return: JSON data object
+        """
+        pass
+
+    def state_signature(self):
+        """
+        Signature of the current progress state (data and binary)
+        """
+        signature = hashlib.sha1(json.dumps(self.data, sort_keys=True).encode())
+
+        if self.binary is not None:
+            signature.update(bytes(self.binary))
+
+        return signature.hexdigest()
+
+    def speculative_advance(self, step_data, answer_value) -> dict:
+        """
+        Same as `advance` but uses the candidate next step precomputed (if available)
+
+        Return: JSON data object
+        """
+        candidate = None
+
+        if answer_value is not None and (self.session.config or {}).get('speculative', False):
+            candidate = speculative_steps.pop(self.id, self.state_signature(), int(answer_value))
+
+        if candidate is None:
+            return self.advance(step_data, answer_value)
+
+        self.data, self.binary, next_step_data = candidate
+        return next_step_data
+
+    def _speculative_candidate(self, data, binary, step_data, answer_value):
+
+        # candidate is computed on a copy of the progress state
+        candidate = copy.copy(self)
+        candidate.data = copy.deepcopy(data)
+        candidate.binary = binary
+
+        next_step_data = candidate.advance(copy.deepcopy(step_data), answer_value)
+
+        return candidate.data, candidate.binary, next_step_data
+
+    def speculate(self, step_data, answer_values=(0, 1)):
+        """
+        Compute in background the candidate next step of each possible answer of the current step
+        (enabled with `"speculative": true` into session config)
+        """
+        if not (self.session.config or {}).get('speculative', False):
+            return
+
+        # related objects are loaded now: candidates never access database
+        self.session.experiment
+
+        data, binary, step_data = copy.deepcopy(self.data), self.binary, copy.deepcopy(step_data)
+
+        candidates = {
+            answer_value: lambda answer_value=answer_value: self._speculative_candidate(data, binary, step_data, answer_value)
+            for answer_value in answer_values
+        }
+
+        speculative_steps.submit(self.id, self.state_signature(), candidates)
+
     @abstractmethod
     def start(self, participant_data):
         """
@@ -252,6 +353,7 @@ class SessionProgress(PolymorphicModel):
     def end(self) -> bool:
         """
         Check whether it's the end or not of the experiment
+        (latest step is available without query using `self.current_step`)
 
         Return: bool
         """
@@ -277,3 +379,6 @@ class SessionStep(models.Model):
     class Meta:
         verbose_name = '[Experiment] session step'
         verbose_name_plural = '[Experiment] session steps'
+        indexes = [
+            models.Index(fields=['progress_type', 'progress_id', 'created_on'], name='experiments_step_progress_idx')
+        ]
@@ -0,0 +1,112 @@
+# main imports
+import os
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from .images import load_image
+from .datasets import get_dataset_pack, get_tiled_dataset
+
+# Pixel work of steps: these functions only use picklable arguments and never access
+# the database, hence they can be run into the pixel pool processes (see `workers.py`)
+
+# version of the rendering process (part of renders keys: update it if renders change)
+render_version = 1
+
+
+def draw_red_box(pil_image, selected_block, padding):
+    """Draw red box around a selected block (padding is included into the box)
+    Args:
+        pil_image ([Image]): PIL image to update
+        selected_block ([list]): block coordinates [x1, y1, x2, y2]
+        padding ([int]): block padding
+    Returns:
+        [Image]: updated PIL image
+    """
+    x1, y1, x2, y2 = selected_block
+    shape = [(x1 - padding * 2, y1 - padding * 2), (x2, y2)]
+
+    image_draw = ImageDraw.Draw(pil_image)
+    image_draw.rectangle(shape, outline ="red", width=3)
+
+    return pil_image
+
+
+def read_images_block(source, scene, images_path, index, x1, y1, x2, y2):
+    """Get reference image and block of an spp level image from the expected dataset source
+    Args:
+        source ([tuple]): (`pack`, folder), (`tiles`, folder) or (`images`, None)
+        scene ([str]): scene name
+        images_path ([list]): sorted images paths of the scene (static folder included)
+        index ([int]): spp level image index
+        x1, y1, x2, y2 ([int]): block coordinates (padding removed)
+    Returns:
+        [tuple]: read-only reference image and block arrays
+    """
+    kind, folder = source
+
+    if kind == 'pack':
+        # memory-mapped images: only the pages of the block are read for spp level
+        pack = get_dataset_pack(folder)
+        return pack.image(scene, -1), pack.read_block(scene, index, x1, y1, x2, y2)
+
+    # reference is shared by all trials (cached)
+    ref_image = load_image(images_path[-1])
+
+    if kind == 'tiles':
+        # only tiles of the block are decoded for spp level
+        return ref_image, get_tiled_dataset(folder).read_region(scene, index, x1, y1, x2, y2)
+
+    return ref_image, load_image(images_path[index])[y1:y2, x1:x2]
+
+
+def render_block_images(source, scene, images_path, index, selected_block, padding, encoder):
+    """Compose block image (spp level block into reference) and reference image, both with red boxes
+    Args:
+        source ([tuple]): dataset source (see `read_images_block`)
+        scene ([str]): scene name
+        images_path ([list]): sorted images paths of the scene (static folder included)
+        index ([int]): spp level image index
+        selected_block ([list]): block coordinates [x1, y1, x2, y2]
+        padding ([int]): block padding
+        encoder ([ImageEncoder]): encoder of generated images
+    Returns:
+        [tuple]: encoded block image and reference image
+    """
+    x1, y1, x2, y2 = selected_block
+
+    # replace block with spp (avoid issue with numpy index access)
+    x1, y1 = max(x1 - padding, 0), max(y1 - padding, 0)
+    x2, y2 = max(x2 - padding, 0), max(y2 - padding, 0)
+
+    ref_image, spp_level_block = read_images_block(source, scene, images_path, index, x1, y1, x2, y2)
+
+    reconstructed_image = np.copy(ref_image)
+    reconstructed_image[y1:y2, x1:x2] = spp_level_block
+
+    # add red boxes
+    reconstructed_pil_image = draw_red_box(Image.fromarray(np.array(reconstructed_image, 'uint8')), selected_block, padding)
+    ref_pil_image = draw_red_box(Image.fromarray(np.array(ref_image, 'uint8')), selected_block, padding)
+
+    return encoder.encode(reconstructed_pil_image), encoder.encode(ref_pil_image)
+
+
+def render_quest_composite(images_folder, ref_filename, filename, encoder):
+    """Compose and encode Quest stimulus: spp level image with reference into bottom right quadrant
+    Args:
+        images_folder ([str]): dataset folder (static folder included)
+        ref_filename ([str]): reference image filename
+        filename ([str]): spp level image filename
+        encoder ([ImageEncoder]): encoder of generated images
+    Returns:
+        [bytes]: encoded composited image
+    """
+    ref_image = load_image(os.path.join(images_folder, ref_filename))
+
+    current_image = np.copy(load_image(os.path.join(images_folder, filename)))
+    h, w, _ = current_image.shape
+
+    # here static merge
+    current_image[int(h/2):h, int(w/2):w, :] = ref_image[int(h/2):h, int(w/2):w, :]
+
+    return encoder.encode(Image.fromarray(current_image))
@@ -0,0 +1,93 @@
+# main imports
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+
+class SpeculativeSteps():
+    """
+    Short-lived cache of candidate next steps computed in background threads
+
+    For each progress, one candidate is computed for each possible answer while the
+    participant is looking at the current step. A candidate is only valid for the
+    progress state (signature) it has been computed from.
+    """
+
+    def __init__(self, max_workers, ttl, timeout):
+        self.max_workers = max_workers
+        self.ttl = ttl
+        self.timeout = timeout
+
+        # counters
+        self.hits = 0
+        self.misses = 0
+
+        self._executor = None
+        self._candidates = {}
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='speculative-step')
+
+        return self._executor
+
+    def _expire(self):
+
+        now = time.monotonic()
+
+        for key in [ k for k, (created, _, _) in self._candidates.items() if now - created > self.ttl ]:
+            del self._candidates[key]
+
+    def submit(self, key, signature, candidates):
+        """
+        Compute candidates in background (previous candidates of the key are replaced)
+
+        Args:
+            key: progress identifier
+            signature: signature of the progress state used by candidates
+            candidates: dict of answer value and function to compute its candidate
+        """
+        with self._lock:
+            self._expire()
+
+            executor = self._get_executor()
+            futures = { answer: executor.submit(candidate) for answer, candidate in candidates.items() }
+            self._candidates[key] = (time.monotonic(), signature, futures)
+
+    def pop(self, key, signature, answer):
+        """
+        Get computed candidate of answer (waits if candidate is still computing)
+
+        Return: candidate result or None if not available
+        """
+        with self._lock:
+            self._expire()
+            _, candidate_signature, futures = self._candidates.pop(key, (None, None, {}))
+
+        future = futures.get(answer)
+
+        if future is None or candidate_signature != signature:
+            self.misses += 1
+            return None
+
+        try:
+            result = future.result(timeout=self.timeout)
+        except Exception as e:
+            print(f'Speculative step not available: {e}')
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return result
+
+
+# process-wide speculative steps
+speculative_steps = SpeculativeSteps(
+    max_workers=getattr(settings, 'SPECULATIVE_STEPS_WORKERS', 4),
+    ttl=getattr(settings, 'SPECULATIVE_STEPS_TTL', 600),
+    timeout=getattr(settings, 'SPECULATIVE_STEPS_TIMEOUT', 10)
+)
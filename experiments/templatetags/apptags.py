@@ -1,5 +1,6 @@
 # django imports
 from django import template
+from django.templatetags.static import static
 
 register = template.Library()
 
@@ -12,6 +13,18 @@ def get_value_from_json(dict_data, key):
     if key:
         return dict_data.get(key)
 
+@register.filter('stimulus_url')
+def get_stimulus_url(src):
+    """
+    usage example {{ image|from_json:'src'|stimulus_url }}
+    generated artifacts already have their own url, other images are static files
+    """
+
+    if src.startswith('/'):
+        return src
+
+    return static(src)
+
 @register.filter('duration_minutes')
 def duration_minutes(td):
     total_seconds = int(td.total_seconds())
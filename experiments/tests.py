@@ -1,3 +1,291 @@
-from django.test import TestCase
+import os
+import pickle
+import shutil
+import tempfile
 
-# Create your tests here.
+import numpy as np
+from PIL import Image
+
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from . import artifacts
+from .models import Experiment, MainPage, EndPage, Session, Participant, SessionStep
+from .experiments.quest import QuestSessionProgress
+from .experiments.one_block import OneBlockSessionProgress
+from .experiments.classes.quest_plus import QuestPlus, QuestPlusBatch, state_headers, state_magic
+from .experiments.classes.psychometric import get_psychometric_function
+
+
+@override_settings(ARTIFACT_STORES=['memory'])
+class RunExperimentStepTests(TestCase):
+    """
+    Database access of each experiment step (`run_experiment_step` view)
+    """
+
+    # session (with experiment and pages), progress (with current step), current step update, progress update,
+    # new step and pointer update, finished progress update (last step) and participant session (read and write into savepoint)
+    max_queries = 11
+
+    def setUp(self):
+
+        # generated stimuli are not kept into the static folder
+        artifacts._store = None
+        self.addCleanup(setattr, artifacts, '_store', None)
+
+    def create_progress(self, progress_class, main_template, session_config, experiment_config=None):
+
+        main_page = MainPage.objects.create(name='main', title='Main', template=main_template,
+                                           content={'description': '', 'question': ''})
+        end_page = EndPage.objects.create(name='end', title='End', template='pages/end/basic_end.html',
+                                         content={'end_text': '', 'thanks_text': ''})
+
+        self.experiment = Experiment.objects.create(title=progress_class.__name__, description='Experiment',
+                                                    main_page=main_page, end_page=end_page,
+                                                    config=experiment_config)
+
+        self.session = Session.objects.create(name='session', experiment=self.experiment,
+                                              progress_choice=f'{progress_class.__module__}.{progress_class.__name__}',
+                                              config=session_config)
+
+        participant = Participant.objects.create(name='Anonymous')
+        self.progress = progress_class.objects.create(session=self.session, participant=participant)
+        self.progress.start({'basic-info-know-cg': 1, 'basic-info-why': '', 'basic-info-glasses': 0})
+
+        client_session = self.client.session
+        client_session['progress'] = {str(self.session.id): self.progress.id}
+        client_session.save()
+
+        self.url = reverse('experiments:run_session', kwargs={
+            'slug': self.experiment.slug,
+            'session_id': self.session.id,
+            'progress_id': self.progress.id
+        })
+
+    def run_step(self, answer):
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(self.url, answer)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(len(context), self.max_queries,
+                             '\n'.join(query['sql'] for query in context.captured_queries))
+
+    def test_quest_step_queries(self):
+
+        self.create_progress(QuestSessionProgress, 'pages/main/one_image.html',
+                             {'max_iterations': 6, 'min_iterations': 6, 'stop_entropy': 0.})
+
+        for i in range(6):
+            self.run_step({'quest-answer-time': 100, 'quest-answer-value': i % 2})
+
+        self.assertEqual(SessionStep.objects.filter(progress_id=self.progress.id).count(), 6)
+
+        self.progress.refresh_from_db()
+        self.assertTrue(self.progress.is_finished)
+
+        # current step pointer is the latest step
+        self.assertEqual(self.progress.n_steps, 6)
+        self.assertEqual(self.progress.current_step, SessionStep.objects.filter(progress_id=self.progress.id).latest('created_on'))
+
+    def test_one_block_step_queries(self):
+
+        # small dataset of two scenes
+        dataset_folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, dataset_folder)
+
+        for scene in ['sceneA', 'sceneB']:
+            os.makedirs(os.path.join(dataset_folder, scene))
+
+            for spp in [20, 40, 80]:
+                pixels = np.full((64, 64, 3), spp, 'uint8')
+                Image.fromarray(pixels).save(os.path.join(dataset_folder, scene, f'{scene}_{spp:05d}.png'))
+
+        self.create_progress(OneBlockSessionProgress, 'pages/main/two_images.html',
+                             {'img_size': [64, 64], 'padding': 2, 'block_size': [16, 16]},
+                             {'dataset': dataset_folder})
+
+        # each scene is done with a negative answer (the last one ends the experiment)
+        for answer_value in [1, 0, 0]:
+            self.run_step({'binary-answer-time': 100, 'binary-answer-value': answer_value})
+
+        self.progress.refresh_from_db()
+        self.assertTrue(self.progress.is_finished)
+
+        # final state of the progress is stored
+        self.assertEqual(sorted(self.progress.data['scenes_done']), ['sceneA', 'sceneB'])
+        self.assertEqual(self.progress.progress(), 100)
+
+
+class QuestPlusTests(SimpleTestCase):
+    """
+    Quest+ engine compared to reference computations on a small grid
+    """
+
+    def setUp(self):
+
+        # same kind of domains as QuestSessionProgress (smaller parameters grid)
+        self.stim = np.arange(500, 10500, 500, 'int32')
+        self.params = [self.stim, np.arange(0.0001, 0.001, 0.00009, 'float32')]
+        self.function = get_psychometric_function(None)
+
+    def create_quest(self, **kwargs):
+        return QuestPlus(self.stim, self.params, self.function, **kwargs)
+
+    def get_answers(self, n_trials=12, seed=0):
+        """
+        Deterministic answers of a participant to Quest+ chosen stims
+
+        Return: (stims, responses) lists
+        """
+        rng = np.random.default_rng(seed)
+        qp = self.create_quest()
+        stims, responses = [], []
+
+        for _ in range(n_trials):
+            stim = qp.next_contrast()
+            response = int(rng.random() < 0.75)
+            qp.update(stim, response)
+
+            stims.append(stim)
+            responses.append(response)
+
+        return stims, responses
+
+    def play(self, qp, stims, responses):
+
+        for stim, response in zip(stims, responses):
+            qp.update(stim, response)
+
+        return qp
+
+    def naive_entropy(self, qp):
+        """
+        Expected entropy of each stim from the full (stim, parameters, response) posterior
+        """
+        full_posterior = qp.likelihoods * qp.posterior[np.newaxis, :, np.newaxis]
+        norm = full_posterior.sum(axis=1, keepdims=True)
+        full_posterior = full_posterior / norm
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            H = -np.nansum(full_posterior * np.log(full_posterior), axis=1)
+
+        return (norm[:, 0, :] * H).sum(axis=1)
+
+    def test_fused_entropy(self):
+
+        qp = self.create_quest()
+
+        for n_trials in [0, 12]:
+            self.play(qp, *self.get_answers(n_trials))
+
+            entropy, stim = qp.fused_entropy()
+            expected = self.naive_entropy(qp)
+
+            np.testing.assert_allclose(qp.entropy, expected, rtol=1e-9, atol=1e-12)
+            self.assertAlmostEqual(entropy, expected.min())
+            self.assertEqual(stim, self.stim[expected.argmin()])
+
+    def test_chunked_next_contrast(self):
+
+        answers = self.get_answers()
+        qp = self.play(self.create_quest(), *answers)
+        chunked = self.play(self.create_quest(max_bytes=4096), *answers)
+
+        self.assertTrue(chunked.chunked)
+        self.assertIsNone(chunked.likelihoods)
+        np.testing.assert_allclose(chunked.posterior, qp.posterior)
+
+        self.assertEqual(chunked.next_contrast(), qp.next_contrast())
+        np.testing.assert_allclose(chunked.entropy, qp.entropy, rtol=1e-9, atol=1e-12)
+
+        for axis in range(len(self.params)):
+            self.assertEqual(chunked.next_contrast(axis=axis), qp.next_contrast(axis=axis))
+            np.testing.assert_allclose(chunked.entropy, qp.entropy, rtol=1e-9, atol=1e-12)
+
+    def test_state_round_trip(self):
+
+        stims, responses = self.get_answers()
+        qp = self.play(self.create_quest(), stims, responses)
+
+        for dtype, log_space, rtol in [('float64', False, 1e-12), ('float32', False, 1e-6),
+                                       ('float32', True, 1e-5)]:
+            restored = QuestPlus.from_binary(qp.dumps_state(dtype, log_space), self.stim,
+                                             self.params, self.function)
+
+            np.testing.assert_allclose(restored.posterior, qp.posterior, rtol=rtol, atol=1e-12)
+            self.assertEqual(restored.stim_history, qp.stim_history)
+            self.assertEqual(restored.resp_history, qp.resp_history)
+            self.assertEqual(restored.next_contrast(), qp.next_contrast())
+
+    def test_state_previous_formats(self):
+
+        stims, responses = self.get_answers()
+        qp = self.play(self.create_quest(), stims, responses)
+
+        # version 1 (without pruned mass)
+        data = b''.join([
+            state_headers[1].pack(state_magic, 1, 0, 0, qp.posterior.shape[0], len(stims)),
+            qp.posterior.astype('<f8').tobytes(),
+            np.asarray(stims, '<f8').tobytes(),
+            np.asarray(responses, 'int8').tobytes()
+        ])
+
+        restored = QuestPlus.from_binary(data, self.stim, self.params, self.function)
+
+        np.testing.assert_allclose(restored.posterior, qp.posterior)
+        self.assertEqual(restored.stim_history, list(map(float, stims)))
+        self.assertEqual(restored.resp_history, responses)
+        self.assertEqual(restored.pruned_mass, 0.)
+
+        # pickle of the whole instance
+        restored = QuestPlus.from_binary(pickle.dumps(qp), self.stim, self.params, self.function)
+
+        np.testing.assert_allclose(restored.posterior, qp.posterior)
+        self.assertEqual(restored.next_contrast(), qp.next_contrast())
+
+    def test_replay(self):
+
+        stims, responses = self.get_answers()
+        qp = self.play(self.create_quest(), stims, responses)
+
+        replayed = self.create_quest()
+        replayed.replay(stims, responses)
+
+        np.testing.assert_allclose(replayed.posterior, qp.posterior, rtol=1e-9)
+        self.assertEqual(replayed.next_contrast(), qp.next_contrast())
+
+        # likelihoods computed by chunks
+        chunked = self.create_quest(max_bytes=4096)
+        chunked.replay(stims, responses)
+
+        np.testing.assert_allclose(chunked.posterior, qp.posterior, rtol=1e-9)
+
+    def test_batch(self):
+
+        answers = [self.get_answers(seed=seed) for seed in range(3)]
+        instances = [self.play(self.create_quest(), *answer) for answer in answers]
+
+        # procedures advanced together
+        batch = QuestPlusBatch(self.stim, self.params, self.function, len(answers))
+
+        for trial in range(len(answers[0][0])):
+            stim_idx = batch.stim_index([stims[trial] for stims, _ in answers])
+            batch.update_many(stim_idx, [responses[trial] for _, responses in answers])
+
+        np.testing.assert_allclose(batch.posteriors, [qp.posterior for qp in instances], rtol=1e-9)
+
+        stim_idx, entropy = batch.next_many()
+
+        for qp, idx, min_entropy in zip(instances, stim_idx, entropy):
+            self.assertEqual(self.stim[idx], qp.next_contrast())
+            self.assertAlmostEqual(min_entropy, qp.entropy.min())
+
+        # histories collapsed into counts
+        batch = QuestPlusBatch(self.stim, self.params, self.function, len(answers))
+        batch.fit_counts([qp.history_counts(*answer) for qp, answer in zip(instances, answers)])
+
+        np.testing.assert_allclose(batch.posteriors, [qp.posterior for qp in instances], rtol=1e-9)
+        np.testing.assert_array_equal(batch.get_fit_params_many(), [qp.get_fit_params() for qp in instances])
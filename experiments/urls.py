@@ -17,6 +17,7 @@ urlpatterns = [
     path('experiments/<slug:slug>/session/<int:session_id>/run/<int:progress_id>', views.run_experiment_step, name='run_session'),
     path('experiments/experiment/stat', views.experiment_stat, name='experiment_stat'),
     path('participant/check', views.check_participant, name='check_participant'),
+    path('artifacts/<str:key>', views.serve_artifact, name='artifact'),
 
     # others routes
     path('documentation', views.load_documentation, name='load_documentation'),
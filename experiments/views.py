@@ -7,8 +7,10 @@ from django.conf import settings
 from django.http import Http404
 from django.http import HttpResponseNotAllowed
 from django.http import JsonResponse
+from django.http import HttpResponseNotModified
 from django.core.serializers import serialize
 from . import utils
+from . import artifacts
 from django.contrib.auth.decorators import user_passes_test
 import json
 
@@ -203,7 +205,7 @@ def load_information_page(request, slug, session_id):
                 try:
                     progress_id = int(request.session['progress'][session_id_str])
             
-                    progress = progress_class.objects.get(id=progress_id)
+                    progress = progress_class.objects.select_related('current_step').get(id=progress_id)
                     
                     if progress.data is None:
                         
@@ -227,8 +229,9 @@ def load_information_page(request, slug, session_id):
                     else:  
                         
                         # start if experiment is started or not (participant quit at example or not)
-                        try:
-                            previous_step = SessionStep.objects.filter(progress_id=progress.id).latest('created_on')
+                        previous_step = progress.current_step
+
+                        if previous_step is not None:
 
                             context = {
                                 'page': experiment.main_page,
@@ -241,7 +244,7 @@ def load_information_page(request, slug, session_id):
                             
                             # dynamic rendering with use of custom page template
                             return render(request, f'{experiment.main_page.template}', context)
-                        except:
+                        else:
                             print(f'Cannot load with previous step')
 
                             context = {
@@ -337,14 +340,21 @@ def run_experiment_step(request, slug, session_id, progress_id):
         [HttpResponse]: Http response message
     """
     if request.method == 'POST':
-        # access using unique slug
-        experiment = Experiment.objects.get(slug=slug)
-        session = Session.objects.get(id=session_id)
+        # session with its experiment and pages (single query, access using unique slug)
+        session = Session.objects.select_related(
+            'experiment', 'experiment__main_page', 'experiment__end_page'
+        ).get(id=session_id, experiment__slug=slug)
+
+        experiment = session.experiment
         main_page = experiment.main_page
 
         progress_class = utils.load_progress_class(session.progress_choice)
         
-        progress = progress_class.objects.get(id=progress_id)
+        # current step is loaded with the progress
+        progress = progress_class.objects.select_related('current_step').get(id=progress_id, session_id=session.id)
+
+        # already loaded: avoid lazy queries into `next`, `progress` and `end`
+        progress.session = session
 
         # retrieve previous step if exists
         previous_step = None
@@ -353,29 +363,25 @@ def run_experiment_step(request, slug, session_id, progress_id):
         if not progress.is_started:
             progress.is_started = True
         else:
-            previous_step = SessionStep.objects.filter(progress_id=progress.id).latest('created_on')
+            previous_step = progress.current_step
 
         # send previous step (if exists) and request dict form data
         step_data = progress.next(previous_step, request.POST)
 
         # create new state
-        experiment_step = SessionStep.objects.create(
-            progress=progress,
-            data=step_data
-        )
+        experiment_step = progress.add_step(step_data)
 
-        # session = Session.objects.get(id=progress.session.id)
-        # print(session.participants.all())
-        # print('There is some expe steps:', SessionStep.objects.filter(progress_id=progress.id).all().count())
+        # new step is the current step of the progress (no need to query it again)
         if progress.end():
             
             # passed as finished state
             progress.is_finished = True
-            progress.save()
+            # (state of the last step is also stored: `next` may not save it)
+            progress.save(update_fields=['is_finished', 'data', 'binary'])
 
-            # remove from session
-            del request.session['progress'][str(progress.session.id)]
-            request.session.save()
+            # remove from session (saved once by the session middleware)
+            del request.session['progress'][str(session.id)]
+            request.session.modified = True
             
             end_page = experiment.end_page
 
@@ -459,6 +465,41 @@ def experiment_stat(request):
 
     return HttpResponse(json.dumps(final_progress_data), content_type="application/json")
 
+def serve_artifact(request, key):
+    """Serve generated artifact (stimulus) from artifact store
+    Args:
+        request ([Request]): Django request instance
+        key ([str]): content-addressed key of the artifact
+    Returns:
+        [HttpResponse]: encoded artifact with immutable cache headers
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return HttpResponseNotAllowed(['GET', 'HEAD'])
+
+    if not artifacts.is_valid_key(key):
+        raise Http404(f'Unknown artifact: {key}')
+
+    # artifact key never changes for a same content: strong ETag
+    etag = f'"{key}"'
+    cache_control = 'public, max-age=31536000, immutable'
+
+    if etag in request.headers.get('If-None-Match', ''):
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        response['Cache-Control'] = cache_control
+        return response
+
+    data = artifacts.get_artifact_store().get(key)
+
+    if data is None:
+        raise Http404(f'Unknown artifact: {key}')
+
+    response = HttpResponse(data, content_type=artifacts.content_types[key.split('.')[-1]])
+    response['ETag'] = etag
+    response['Cache-Control'] = cache_control
+
+    return response
+
 @user_passes_test(lambda user: user.is_superuser)
 def download_session_progresses(request, session_id):
     """Create JSON file as output and send it
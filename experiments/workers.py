@@ -0,0 +1,139 @@
+# main imports
+import time
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+
+
+class PixelPool():
+    """
+    Process pool used for the CPU-bound pixel work of steps (compositing, drawing, encoding)
+
+    Functions sent to the pool must be importable without Django models (see
+    `experiments.rendering`) and their arguments must be picklable. If the pool is
+    disabled (no worker) or broken, or if a job is still waiting for a worker at the
+    deadline, the work is done inline, into the request thread (a job already running
+    is awaited instead of being done twice).
+    """
+
+    def __init__(self, max_workers, timeout, start_method='spawn'):
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.start_method = start_method
+
+        # counters
+        self.pooled = 0
+        self.inline = 0
+        self.timeouts = 0
+        self.failures = 0
+
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.max_workers > 0
+
+    def _get_executor(self):
+
+        with self._lock:
+            if self._executor is None:
+                context = multiprocessing.get_context(self.start_method)
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=context)
+
+            return self._executor
+
+    def _reset(self, executor):
+
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+
+        executor.shutdown(wait=False)
+
+    def run(self, function, *args):
+        """
+        Run function into the pool (inline if pool is disabled or if deadline is exceeded)
+
+        Return: function result
+        """
+        return self.run_many(function, [args])[0]
+
+    def run_many(self, function, args_list):
+        """
+        Run function for each arguments tuple into the pool, the deadline is shared by all calls
+
+        Return: list of results (same order as arguments)
+        """
+        if not self.enabled:
+            self.inline += len(args_list)
+            return [ function(*args) for args in args_list ]
+
+        executor = self._get_executor()
+
+        try:
+            futures = [ executor.submit(function, *args) for args in args_list ]
+        except (BrokenProcessPool, RuntimeError) as e:
+            print(f'Pixel pool not available: {e}')
+            self.failures += 1
+            self._reset(executor)
+            futures = []
+
+        results = []
+        deadline = time.monotonic() + self.timeout
+
+        for i, args in enumerate(args_list):
+
+            if i < len(futures):
+                try:
+                    results.append(futures[i].result(timeout=max(deadline - time.monotonic(), 0)))
+                    self.pooled += 1
+                    continue
+                except TimeoutError:
+                    self.timeouts += 1
+
+                    # a job already running is never done twice: its late result is awaited
+                    if not futures[i].cancel():
+                        try:
+                            results.append(futures[i].result())
+                            self.pooled += 1
+                            continue
+                        except BrokenProcessPool as e:
+                            print(f'Pixel pool broken: {e}')
+                            self.failures += 1
+                            self._reset(executor)
+                except BrokenProcessPool as e:
+                    print(f'Pixel pool broken: {e}')
+                    self.failures += 1
+                    self._reset(executor)
+
+            # fallback into the current thread
+            results.append(function(*args))
+            self.inline += 1
+
+        return results
+
+    def stats(self) -> dict:
+        """
+        Get pool usage information
+
+        Return: dict with number of pooled, inline, timed out and failed calls
+        """
+        return {
+            'workers': self.max_workers,
+            'pooled': self.pooled,
+            'inline': self.inline,
+            'timeouts': self.timeouts,
+            'failures': self.failures
+        }
+
+
+# process-wide pool (disabled with 0 worker)
+pixel_pool = PixelPool(
+    max_workers=getattr(settings, 'PIXEL_WORKERS', 0),
+    timeout=getattr(settings, 'PIXEL_WORKERS_TIMEOUT', 5),
+    start_method=getattr(settings, 'PIXEL_WORKERS_START_METHOD', 'spawn')
+)
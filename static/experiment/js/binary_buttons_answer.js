@@ -2,23 +2,46 @@
 document.addEventListener('DOMContentLoaded',() => {
 
     var start_answer_time = null;
-    var experiment_images = document.querySelectorAll('img[class="experiment-image"]')
-    
-
-    if (experiment_images !== null) {
-        experiment_images.forEach(e => { 
-            e.style.display = 'inline'
-        });
+    var experiment_images = document.querySelectorAll('img.experiment-image, canvas.experiment-image')
+    var answer_buttons = document.querySelectorAll('form[class="binary-answer-form"] button[type="submit"]')
+
+    // stimulus is available once the page is loaded, or once canvases are drawn (client side compositing)
+    const onStimuliReady = callback => {
+        let stimuli = document.querySelector('div[id="block-compositing"]')
+
+        if (stimuli === null || stimuli.dataset.ready === 'true') {
+            callback()
+        } else {
+            document.addEventListener('block-compositing-ready', callback, { once: true })
+        }
     }
 
-    // Once images are loaded, the stimulus is then available we can measure the answer time
-    start_answer_time = Date.now();
+    // no answer before the stimulus is visible
+    answer_buttons.forEach(b => { b.disabled = true });
+
+    onStimuliReady(() => {
+
+        if (experiment_images !== null) {
+            experiment_images.forEach(e => { 
+                e.style.display = 'inline'
+            });
+        }
+
+        answer_buttons.forEach(b => { b.disabled = false });
+
+        // Once images are displayed, the stimulus is then available we can measure the answer time
+        start_answer_time = Date.now();
+    })
 
     // Do whatever you want
     document.querySelector('form[class="binary-answer-form"]').onsubmit = (e) => {	
         
         e.preventDefault();
 
+        if (start_answer_time === null) {
+            return
+        }
+
         // get answer from button
         let answer_value = document.activeElement['value']
 
@@ -39,20 +39,32 @@ const checkKey = e => {
 document.addEventListener('DOMContentLoaded',() => {
 
     // load images
-    var start_answer_time = null;
-    var experiment_images = document.querySelectorAll('img[class="experiment-image"]')
-    
-
-    if (experiment_images !== null) {
-        experiment_images.forEach(e => { 
-            e.style.display = 'inline'
-        });
+    var experiment_images = document.querySelectorAll('img.experiment-image, canvas.experiment-image')
+
+    // stimulus is available once the page is loaded, or once canvases are drawn (client side compositing)
+    const onStimuliReady = callback => {
+        let stimuli = document.querySelector('div[id="block-compositing"]')
+
+        if (stimuli === null || stimuli.dataset.ready === 'true') {
+            callback()
+        } else {
+            document.addEventListener('block-compositing-ready', callback, { once: true })
+        }
     }
 
-    // Once images are loaded, the stimulus is then available we can measure the answer time
-    start_answer_time = Date.now();
+    onStimuliReady(() => {
+
+        if (experiment_images !== null) {
+            experiment_images.forEach(e => { 
+                e.style.display = 'inline'
+            });
+        }
+
+        // Once images are displayed, the stimulus is then available we can measure the answer time
+        start_answer_time = Date.now();
 
-    // implement `key` events when document loaded
-    document.addEventListener('keydown', checkKey)
+        // implement `key` events only when the stimulus is visible
+        document.addEventListener('keydown', checkKey)
+    })
 });
 
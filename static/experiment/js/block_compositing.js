@@ -0,0 +1,65 @@
+// Client side compositing of block experiments (`"compositing": "client"` into OneBlock session config)
+// Left canvas: reference image with spp level block, right canvas: reference image
+// `block-compositing-ready` event is sent on document once both canvases are drawn
+
+const loadCompositingImage = src => new Promise((resolve, reject) => {
+    let image = new Image()
+    image.onload = () => resolve(image)
+    image.onerror = reject
+    image.src = src
+})
+
+// same red box as server side rendering (PIL rectangle of width 3)
+const drawRedBox = (context, block, padding) => {
+
+    let [x1, y1, x2, y2] = block
+    let x0 = x1 - padding * 2
+    let y0 = y1 - padding * 2
+
+    context.strokeStyle = 'red'
+    context.lineWidth = 3
+    context.strokeRect(x0 + 1.5, y0 + 1.5, x2 - x0 - 2, y2 - y0 - 2)
+}
+
+document.addEventListener('DOMContentLoaded', () => {
+
+    let stimuli = document.querySelector('div[id="block-compositing"]')
+
+    if (stimuli === null) {
+        return
+    }
+
+    let block = stimuli.dataset.selectedBlock.split(',').map(v => parseInt(v))
+    let padding = parseInt(stimuli.dataset.padding)
+
+    let left_canvas = document.querySelector('canvas[id="block-compositing-left"]')
+    let right_canvas = document.querySelector('canvas[id="block-compositing-right"]')
+
+    Promise.all([
+        loadCompositingImage(stimuli.dataset.reference),
+        loadCompositingImage(stimuli.dataset.block)
+    ]).then(([reference, spp_block]) => {
+
+        // canvas resolution is the one of source images (displayed size is kept)
+        [left_canvas, right_canvas].forEach(canvas => {
+            canvas.width = reference.naturalWidth
+            canvas.height = reference.naturalHeight
+            canvas.getContext('2d').drawImage(reference, 0, 0)
+        })
+
+        // replace block with spp level (padding removed)
+        let [x1, y1, x2, y2] = block.map(v => Math.max(v - padding, 0))
+        let left_context = left_canvas.getContext('2d')
+
+        if (x2 > x1 && y2 > y1) {
+            left_context.drawImage(spp_block, x1, y1, x2 - x1, y2 - y1, x1, y1, x2 - x1, y2 - y1)
+        }
+
+        drawRedBox(left_context, block, padding)
+        drawRedBox(right_canvas.getContext('2d'), block, padding)
+
+        // stimulus is now visible: answer scripts can start (see `binary_*_answer.js`)
+        stimuli.dataset.ready = 'true'
+        document.dispatchEvent(new Event('block-compositing-ready'))
+    })
+});
@@ -145,6 +145,38 @@ STATICFILES_DIRS = [
 
 OUPUT_DATA_FOLDER = 'data'
 
+# Maximum memory (in bytes) of decoded images cached by experiments progress
+IMAGE_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# Stores of generated stimuli (artifacts), read in order: `memory` and/or `filesystem`
+# (`filesystem` keeps stimuli of steps available after memory eviction, restarts and between processes)
+ARTIFACT_STORES = ['memory', 'filesystem']
+ARTIFACT_MEMORY_MAX_BYTES = 128 * 1024 * 1024
+
+# Disk budget and time to live (since last access) of `filesystem` artifacts, None for unbounded
+# (compaction is done in background each time ARTIFACT_FILESYSTEM_COMPACT_EVERY bytes are written by a process)
+ARTIFACT_FILESYSTEM_MAX_BYTES = 2 * 1024 * 1024 * 1024
+ARTIFACT_FILESYSTEM_TTL = 30 * 24 * 3600 # in seconds
+ARTIFACT_FILESYSTEM_COMPACT_EVERY = 64 * 1024 * 1024
+
+# Background computation of next steps candidates (`"speculative": true` into session config)
+SPECULATIVE_STEPS_WORKERS = 4
+SPECULATIVE_STEPS_TTL = 600 # in seconds
+SPECULATIVE_STEPS_TIMEOUT = 10 # in seconds
+
+# Processes used for pixel work of steps (compositing, drawing, encoding), 0 for inline work
+# (if a step is not ready before the deadline, it is computed into the request thread)
+PIXEL_WORKERS = 0
+PIXEL_WORKERS_TIMEOUT = 5 # in seconds
+PIXEL_WORKERS_START_METHOD = 'spawn'
+
+# Quest+ likelihood tables are shared by all participants, also between processes using shared memory
+QUEST_LIKELIHOODS_SHARED_MEMORY = False
+# Memory used by cached likelihood tables of a process (least recently used tables are removed first)
+QUEST_LIKELIHOODS_CACHE_MAX_BYTES = 512 * 1024 * 1024
+# Larger likelihood tables are never stored: they are computed by chunks under this memory ceiling (None for no limit)
+QUEST_LIKELIHOODS_MAX_BYTES = None
+
 STATICFILES_DIRS = (
     os.path.join(BASE_DIR, 'static'),
 )